@@ -2,6 +2,7 @@ import time
 import logging
 
 from pedal_communication import UdpPedalDevice, DataType, DataCollector
+from pedal_communication.devices.generic_device import GenericDevice
 
 
 def do_something(data_collector: DataCollector):
@@ -13,18 +14,30 @@ def do_something(data_collector: DataCollector):
     logger.info("Start doing something with the data collector...")
     for _ in range(10):
         time.sleep(1)
-        logger.info(f"Collected {len(data_collector.data.timestamp)} data points.")
-    logger.info(f"Collected data timestamps: {data_collector.data.timestamp}")
+        logger.info("Collected %d data points.", len(data_collector.data.timestamp))
+    logger.info("Collected data timestamps: %s", data_collector.data.timestamp)
+
+
+def connect_with_backoff(device: GenericDevice, initial_delay: float = 0.01, max_delay: float = 1.0) -> None:
+    """
+    Try to connect to the device until it succeeds, doubling the delay between attempts (capped to max_delay)
+    """
+    delay = initial_delay
+    while not device.connect():
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
 
 
 def main():
     logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 
     # Connect to the device. If no real devices are available, one can run the script `mocked_device.py` to create a
-    # local TCP mock device that simulates a real pedal device.
+    # local mock device that simulates a real pedal device.
+    # The UDP device is preferred for live plotting: late or out-of-order frames are dropped (based on their sequence
+    # id) instead of stalling the stream. The `TcpPedalDevice` guarantees that every answered frame arrives in order,
+    # which suits reliable collections better, at the cost of head-of-line blocking when a packet is lost.
     device = UdpPedalDevice()
-    while not device.connect():
-        time.sleep(0.5)
+    connect_with_backoff(device)
 
     data_collector = DataCollector(device)
 
@@ -1,13 +1,11 @@
 from enum import Enum
 import time
 import threading
-import queue
 from typing import Iterable
 
 import numpy as np
 
 from ..devices.generic_device import GenericDevice
-from ..misc import classproperty
 
 
 class DataType(Enum):
@@ -75,40 +73,85 @@ class DataType(Enum):
 
 
 class Data:
+    columns_count = len(DataType)
+    _initial_capacity = 1024
+    # Sensor values do not need double precision, storing them as float32 halves the memory traffic. Timestamps are
+    # kept in double precision as they need the range
+    _values_dtype = np.float32
+
     def __init__(self, data: np.ndarray | None = None):
         if data is None:
             data = np.empty((0, self.columns_count + 1))
         else:
+            if len(data.shape) == 1:
+                data = data[None, :]
             if data.shape[1] != self.columns_count + 1:
                 raise ValueError(f"Data must have {self.columns_count + 1} columns.")
-        self._data = data
-        if len(self._data.shape) == 1:
-            self._data = self._data[None, :]
+
+        # The data are stored in pre-allocated buffers that grow geometrically, so appending is amortized O(1)
+        self._size = data.shape[0]
+        self._capacity = max(self._size, Data._initial_capacity)
+        self._timestamps = np.empty(self._capacity, dtype=np.float64)
+        self._values = np.empty((self._capacity, self.columns_count), dtype=Data._values_dtype)
+        self._timestamps[: self._size] = data[:, 0]
+        self._values[: self._size, :] = data[:, 1:]
+
+    @classmethod
+    def _wrap(cls, timestamps: np.ndarray, values: np.ndarray) -> "Data":
+        """
+        Create a Data that shares the memory of timestamps and values, without validating them (internal use only). The
+        shared memory is never written through the wrapped Data, as its buffers are reallocated the first time data are
+        added. The Data they come from never writes over them either (see clear).
+        """
+        wrapped = cls.__new__(cls)
+        wrapped._timestamps = timestamps if len(timestamps.shape) == 1 else timestamps[None]
+        wrapped._values = values if len(values.shape) == 2 else values[None, :]
+        wrapped._size = wrapped._timestamps.shape[0]
+        wrapped._capacity = 0  # The writable capacity, so the first add_data reallocates
+        return wrapped
 
     def add_data(self, new_data: np.ndarray) -> None:
-        self._data = np.concatenate((self._data, new_data), axis=0)
+        if len(new_data.shape) == 1:
+            new_data = new_data[None, :]
+        new_size = self._size + new_data.shape[0]
+
+        if new_size > self._capacity:
+            new_capacity = max(self._capacity * 2, new_size, Data._initial_capacity)
+            new_timestamps = np.empty(new_capacity, dtype=np.float64)
+            new_values = np.empty((new_capacity, self.columns_count), dtype=Data._values_dtype)
+            new_timestamps[: self._size] = self._timestamps[: self._size]
+            new_values[: self._size, :] = self._values[: self._size, :]
+            self._timestamps = new_timestamps
+            self._values = new_values
+            self._capacity = new_capacity
+
+        self._timestamps[self._size : new_size] = new_data[:, 0]
+        self._values[self._size : new_size, :] = new_data[:, 1:]
+        self._size = new_size
 
     @property
     def timestamp(self) -> np.ndarray:
-        return self._data[:, 0]
-
-    @classproperty
-    def columns_count(cls) -> int:
-        return len(DataType)
+        return self._timestamps[: self._size]
 
     @property
     def is_empty(self) -> bool:
-        return self._data.shape[0] == 0
+        return self._size == 0
 
     def __getitem__(self, time_indices: int | slice | tuple | list) -> "Data":
-        return Data(data=self._data[time_indices, :])
+        size = self._size
+        return Data._wrap(self._timestamps[:size][time_indices], self._values[:size][time_indices, :])
 
     @property
     def values(self) -> np.ndarray:
-        return self._data[:, 1:]
+        return self._values[: self._size, :]
 
     def clear(self) -> None:
-        self._data = np.empty((0, self.columns_count + 1))
+        # Drop the buffers instead of reusing them, as slices (and the timestamp/values arrays handed out) may still
+        # point to them. The next add_data allocates new ones
+        self._size = 0
+        self._capacity = 0
+        self._timestamps = np.empty(0, dtype=np.float64)
+        self._values = np.empty((0, self.columns_count), dtype=Data._values_dtype)
 
     def show(self, data_type: DataType, show_now: bool) -> None:
         from matplotlib import pyplot as plt
@@ -118,43 +161,129 @@ class Data:
             plt.show()
 
 
+class _RingBuffer:
+    """
+    Fixed capacity single-producer/single-consumer ring buffer of data rows. The producer only writes the rows and then
+    advances head, so readers that read head first always see fully written rows (as long as they are not overrun).
+    """
+
+    def __init__(self, capacity: int, columns_count: int):
+        if capacity <= 0 or capacity & (capacity - 1) != 0:
+            raise ValueError("The capacity of the ring buffer must be a power of two.")
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._buffer = np.empty((capacity, columns_count))
+        self._head = 0  # Total number of rows ever written
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def head(self) -> int:
+        return self._head
+
+    def push(self, new_data: np.ndarray) -> None:
+        """
+        Write the rows of new_data at the head of the ring. If there are more rows than the capacity, only the last ones
+        are kept (as if all of them were written one after the other)
+        """
+        row_count = new_data.shape[0]
+        if row_count > self._capacity:
+            self._head += row_count - self._capacity
+            new_data = new_data[-self._capacity :, :]
+            row_count = self._capacity
+        index = self._head & self._mask
+        first_part_len = min(row_count, self._capacity - index)
+        self._buffer[index : index + first_part_len, :] = new_data[:first_part_len, :]
+        self._buffer[: row_count - first_part_len, :] = new_data[first_part_len:, :]
+        self._head += row_count
+
+    def chunks(self, start: int, end: int) -> Iterable[np.ndarray]:
+        """
+        Get views of the rows [start, end[ (in total number of rows written), as at most two contiguous chunks
+        """
+        while start < end:
+            index = start & self._mask
+            chunk_len = min(end - start, self._capacity - index)
+            yield self._buffer[index : index + chunk_len, :]
+            start += chunk_len
+
+
 class DataCollector(threading.Thread):
+    _ring_capacity = 1 << 14  # Must be a power of two
+    _history_flush_period = 0.1  # seconds
+
     def __init__(self, device: GenericDevice):
         super().__init__(daemon=True)
-        self._queue = queue.Queue()
         self._device = device
+        self._run_event = threading.Event()
+        self._started_event = threading.Event()
+
+        # The acquisition thread only writes to the ring buffer, which is moved in bulk to the history (self._data) by a
+        # secondary thread. This way, acquiring data never waits for the history to grow
+        self._ring = _RingBuffer(DataCollector._ring_capacity, Data.columns_count + 1)
+        self._ring_origin = 0  # First row of the ring that belongs to the current acquisition
+        self._ring_tail = 0  # First row of the ring that is not in the history yet
         self._data = Data()
-        self._is_running = False
+        self._history_lock = threading.Lock()
+        self._history_thread = threading.Thread(target=self._flush_history_loop, daemon=True)
 
     @property
     def data(self) -> Data:
+        self._flush_history()
         return self._data
 
     def start(self) -> None:
-        self._is_running = True
+        # The acquisition starts at the current head, which must be recorded before the acquisition thread is allowed to
+        # run, otherwise the first rows it pushes would be skipped
+        with self._history_lock:
+            self._ring_origin = self._ring.head
+            self._ring_tail = self._ring.head
+            self._data.clear()
+        self._run_event.set()
         if not self.is_alive():
             super().start()
-        self._data.clear()
+            self._history_thread.start()
 
     def stop(self) -> None:
-        self._is_running = False
+        self._run_event.clear()
 
     def run(self) -> None:
-        condition = threading.Condition()
+        self._started_event.set()
         while self.is_alive():
-            with condition:
-                while not self._is_running:
-                    condition.wait()
+            self._run_event.wait()
 
+            # The device is expected to block until new data are available, so no sleep is required here
             data = self._device.get_last_data()
-            if data is not None:
-                self._data.add_data(data)
-                self._queue.put(True)
+            if data is None:
+                # The device has nothing to give (e.g. it is reconnecting), avoid hammering it
+                time.sleep(0.001)
+                continue
 
-            time.sleep(0.001)  # avoid burning CPU
+            self._ring.push(data)
 
         self._device.disconnect()
 
+    def _flush_history(self) -> None:
+        """
+        Move the rows of the ring buffer that are not in the history yet to the history
+        """
+        with self._history_lock:
+            head = self._ring.head
+            if head - self._ring_tail > self._ring.capacity:
+                # The oldest rows were overwritten before they could be moved, there is nothing to do but skip them
+                self._ring_tail = head - self._ring.capacity
+            for chunk in self._ring.chunks(self._ring_tail, head):
+                self._data.add_data(chunk)
+            self._ring_tail = head
+
+    def _flush_history_loop(self) -> None:
+        while True:
+            self._run_event.wait()
+            self._flush_history()
+            time.sleep(DataCollector._history_flush_period)
+
     def show_live(self, data_type: DataType | Iterable[DataType], window_len: int = 300) -> None:
         import pyqtgraph as pg
         from pyqtgraph.Qt import QtWidgets, QtCore
@@ -162,28 +291,48 @@ class DataCollector(threading.Thread):
         if not isinstance(data_type, Iterable):
             data_type = [data_type]
 
-        data_indices = [dt.value for dt in data_type]
+        if window_len > self._ring.capacity:
+            raise ValueError(f"window_len cannot be larger than {self._ring.capacity}.")
+
+        # The time column followed by the requested data (+1 to skip the time column of the buffer)
+        column_indices = np.asarray([0] + [dt.value + 1 for dt in data_type], dtype=np.intp)
+        # Scratch buffer reused across frames, so redrawing does not allocate
+        plot_buffer = np.empty((window_len, len(column_indices)))
         colors = ["r", "g", "b", "c", "m", "y", "w"]
 
+        last_drawn_head = -1
+
         def update():
-            # read all items currently available
-            while not self._queue.empty():
-                # Empty the queue
-                _ = self._queue.get()
-
-            starting_index = len(self._data.timestamp) - window_len if len(self._data.timestamp) > window_len else 0
-            data = self._data[starting_index:]
-            if data.is_empty:
+            nonlocal last_drawn_head
+
+            # Skip the redraw if no new data arrived since the last one
+            head = self._ring.head
+            if head == last_drawn_head:
                 return
+            last_drawn_head = head
+
+            # Read the most recent rows directly from the ring buffer, so the plot does not depend on the history
+            starting_index = max(self._ring_origin, head - window_len)
+            if head <= starting_index:
+                return
+
+            # Gather the time and all the curves at once into the scratch buffer
+            row_count = 0
+            for chunk in self._ring.chunks(starting_index, head):
+                chunk_len = chunk.shape[0]
+                np.take(chunk, column_indices, axis=1, out=plot_buffer[row_count : row_count + chunk_len, :])
+                row_count += chunk_len
+            window = plot_buffer[:row_count, :]
 
-            for curve, data_index in zip(curves, data_indices):
-                curve.setData(data.timestamp, data.values[:, data_index])
-            plot.setXRange(data.timestamp[0], data.timestamp[-1])
+            timestamps = window[:, 0]
+            for index, curve in enumerate(curves):
+                curve.setData(timestamps, window[:, index + 1])
+            plot.setXRange(timestamps[0], timestamps[-1])
 
         app = QtWidgets.QApplication([])
         win = pg.GraphicsLayoutWidget(show=True, title="Data Live Plot")
         plot = win.addPlot()
-        curves = [plot.plot(pen=colors[idx]) for idx, i in enumerate(data_indices)]
+        curves = [plot.plot(pen=colors[idx]) for idx in range(len(column_indices) - 1)]
 
         timer = QtCore.QTimer()
         timer.timeout.connect(update)
@@ -195,8 +344,8 @@ class DataCollector(threading.Thread):
             was_started_from_here = True
             self.start()
         # Make sure the thread is running
-        while not self._is_running:
-            time.sleep(0.1)
+        self._started_event.wait()
+        self._run_event.wait()
 
         app.exec()
         if was_started_from_here:
@@ -6,7 +6,9 @@ class GenericRequestProtocol(ABC):
     @abstractmethod
     def serialized(self) -> bytes:
         """
-        Get the serialized byte representation of the request.
+        Get the serialized byte representation of the request. Requests are immutable, so implementations are expected
+        to serialize once when the request is created and return the same object on every access, which can be handed
+        to socket.sendall as is (bytes support the buffer protocol, so no copy is made when sending).
 
         Returns:
             bytes: The serialized request.
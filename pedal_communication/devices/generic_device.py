@@ -49,10 +49,8 @@ class GenericDevice(ABC):
     @abstractmethod
     def get_last_data(self) -> np.ndarray | None:
         """
-        Receive data from the device.
-
-        Parameters:
-            num_bytes (int): Number of bytes to receive.
+        Receive data from the device. This call is expected to block (for a short amount of time) until new data are
+        available, so callers can poll it in a tight loop without sleeping.
 
         Returns:
             AnswerProtocol | None: The data received from the device, or None if no data was received.
@@ -5,7 +5,10 @@ import numpy as np
 
 from .generic_device import GenericDevice
 from .tpc_communication_protocol import TcpResponseProtocol, TcpRequestProtocol
-from ..misc import recv_exact
+from ..misc import recv_exact_into
+
+_logger = logging.getLogger(__name__)
+_response_header_length = TcpResponseProtocol.header_length
 
 
 class TcpPedalDevice(GenericDevice):
@@ -14,15 +17,27 @@ class TcpPedalDevice(GenericDevice):
         host: str = "localhost",
         port: int = 6000,
         request_type: TcpRequestProtocol.RequestType = TcpRequestProtocol.RequestType.NORMAL,
+        timeout: float = 0.5,
+        socket_buffer_size: int = 1 << 20,
+        pipeline_depth: int = 2,
         *args,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self._host = host
         self._port = port
+        self._timeout = timeout
+        self._socket_buffer_size = socket_buffer_size
+
+        # The protocol is strictly request/response, so keep a few requests in flight to hide the round trip time
+        if pipeline_depth < 1:
+            raise ValueError("pipeline_depth must be at least 1.")
+        self._pipeline_depth = pipeline_depth
+        self._pending_request_count = 0
 
         self._request = TcpRequestProtocol(request_type=request_type)
         self._socket: socket.socket | None = None
+        self._receive_buffer = bytearray(64 * 1024)  # Grown on demand if a frame is larger
 
         self._previous_last_timestamp: float = None
 
@@ -42,29 +57,33 @@ class TcpPedalDevice(GenericDevice):
         return self._port
 
     def connect(self) -> bool:
-        logger = logging.getLogger(__name__)
-
-        logger.debug(f"Attempting to connect to TCP device at {self._host}:{self._port}")
+        _logger.debug("Attempting to connect to TCP device at %s:%d", self._host, self._port)
         if self._socket is not None:
-            logger.debug("Already connected to TCP device.")
+            _logger.debug("Already connected to TCP device.")
             return True  # Already connected
 
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Requests are small and latency sensitive, so disable Nagle's algorithm and give room for bursts of responses
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._socket_buffer_size)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._socket_buffer_size)
         try:
             self._socket.connect((self._host, self._port))
+            # Reads block until data arrive, but not forever so a stalled device does not wedge the caller
+            self._socket.settimeout(self._timeout)
         except socket.error:
-            logger.error(f"Failed to connect to TCP device at {self._host}:{self._port}")
+            _logger.error("Failed to connect to TCP device at %s:%d", self._host, self._port)
             self._socket = None
 
         return self._socket is not None
 
     def disconnect(self) -> bool:
         if self._socket is not None:
-            logger = logging.getLogger(__name__)
-            logger.debug(f"Disconnecting from TCP device at {self._host}:{self._port}")
+            _logger.debug("Disconnecting from TCP device at %s:%d", self._host, self._port)
             self._socket.close()
             self._socket = None
 
+        self._pending_request_count = 0
         self._previous_last_timestamp = None
         return self._socket is None
 
@@ -83,31 +102,40 @@ class TcpPedalDevice(GenericDevice):
             if not self.connect():
                 return None
 
-        # First, we need to send the formating of the data
-        self.send(data=self._request)
+        # First, we need to send the formating of the data. Top up the requests in flight so the device always has one
+        # to answer while the previous response is being processed
+        while self._pending_request_count < self._pipeline_depth:
+            if not self.send(data=self._request):
+                break
+            self._pending_request_count += 1
 
         try:
-            logger = logging.getLogger(__name__)
-            logger.debug(f"Receiving data from TCP device at {self._host}:{self._port}")
-            header_length = TcpResponseProtocol.header_length
-            header = recv_exact(self._socket, header_length)
-            if not header:
-                return None
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug("Receiving data from TCP device at %s:%d", self._host, self._port)
+            header = recv_exact_into(self._socket, self._receive_buffer, _response_header_length)
+            self._pending_request_count -= 1
             data_length = TcpResponseProtocol.get_data_length_from_header(header)
-            data = recv_exact(self._socket, data_length)
-            if not data:
+            if data_length <= 0:
                 return None
+            if data_length > len(self._receive_buffer):
+                self._receive_buffer = bytearray(data_length)
+            # The deserialization copies the data, so it is safe to reuse the receive buffer afterwards
+            data = recv_exact_into(self._socket, self._receive_buffer, data_length)
 
             output = TcpResponseProtocol.deserialize(data)
-            first_timestamp = output[0, 0]
-            last_timestamp = output[-1, 0]
-
-            if self._previous_last_timestamp is not None and first_timestamp < self._previous_last_timestamp:
-                return None
-            self._previous_last_timestamp = last_timestamp
+            if self._previous_last_timestamp is not None:
+                # Only keep the samples that were not already received (timestamps are sorted within a frame)
+                first_new_row = np.searchsorted(output[:, 0], self._previous_last_timestamp, side="right")
+                if first_new_row == output.shape[0]:
+                    return None
+                output = output[first_new_row:, :]
+            self._previous_last_timestamp = output[-1, 0]
 
             return output
-        except socket.error as e:
-            if isinstance(e, ConnectionResetError):
-                self.disconnect()
+        except (ConnectionError, socket.timeout):
+            # The device closed the connection (or reset it). On timeout, part of a frame may still be in flight, so the
+            # stream cannot be trusted anymore either. Either way, reconnect on the next call
+            self.disconnect()
+            return None
+        except socket.error:
             return None
@@ -1,10 +1,20 @@
 from enum import Enum
+import functools
 import struct
 
 import numpy as np
 
 from .generic_communication_protocol import GenericRequestProtocol
-from ..misc import classproperty
+
+# The header of a request is the number of bytes of commands that follow (big endian int)
+_request_header_struct = struct.Struct("!i")
+# The header of a response is the number of doubles in the payload (big endian int)
+_response_header_struct = struct.Struct("!i")
+_response_data_type = np.dtype(">f8")
+
+# The NORMAL and FAST requests ask for the whole table of the device (43 x 10 values). It does not depend on the instance,
+# so it is built once at import time and shared by all the requests
+_full_table_commands = [[i, j] for i in range(43) for j in range(10)]
 
 
 class TcpRequestProtocol(GenericRequestProtocol):
@@ -30,64 +40,74 @@ class TcpRequestProtocol(GenericRequestProtocol):
         AG = [6, 0]
         AD = [6, 1]
 
+    # Enum.value goes through a descriptor, so the values are looked up once and for all
+    _command_values = {command: command.value for command in Command}
+
     def __init__(self, request_type: RequestType | None = None, command: list[Command] | None = None):
         if command is not None and request_type is not None:
             raise ValueError("Specify either command or request_type, not both.")
         if command is None:
-            if request_type == self.RequestType.NORMAL:
-                self._commands = [[i, j] for i in range(43) for j in range(10)]
-            elif request_type == self.RequestType.FAST:
-                self._commands = [[i, j] for i in range(43) for j in range(10)]
-            else:
+            # FAST is an alias of NORMAL for now: both request the whole table
+            if request_type not in (self.RequestType.NORMAL, self.RequestType.FAST):
                 raise ValueError("Unsupported request type.")
-        else:
-            self._commands = [cmd.value for cmd in command]
+            self._commands = _full_table_commands
+            self._serialized = _full_table_serialized
+            return
 
-        if not self._commands:
+        command = tuple(command)
+        if not command:
             raise ValueError("Command cannot be empty.")
+        self._commands = [TcpRequestProtocol._command_values[cmd] for cmd in command]
 
-        # Make sure the self._command is a rectangular list
-        row_lengths = {len(row) for row in self._commands}
-        if len(row_lengths) != 1:
-            raise ValueError("Command must be a rectangular list.")
+        # The request is immutable, so it can be serialized once and for all (and recurring sets of commands are only
+        # serialized the first time they are requested)
+        self._serialized = TcpRequestProtocol._serialize_commands(command)
 
-        # Parse the data into bytes
-        self._commands_lengths = struct.pack("!i", len(self._commands) * len(self._commands[0]))
-        self._commands_as_bytes = TcpRequestProtocol._command_to_bytes(self._commands)
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _serialize_commands(command: tuple[Command, ...]) -> bytes:
+        return TcpRequestProtocol._serialize([TcpRequestProtocol._command_values[cmd] for cmd in command])
 
     @staticmethod
-    def _command_to_bytes(commands: list[list[int]]) -> bytes:
-        commands_as_bytes = b""
-        for commands_row in commands:
-            for command in commands_row:
-                # we chose unsigned char 8 (range from 0 to 511) so each x or y coordinates can be store on 1 byte
-                commands_as_bytes += struct.pack("!B", command)
-        return commands_as_bytes
+    def _serialize(commands: list[list[int]]) -> bytes:
+        # Converting to an array checks in a single pass that the commands form a rectangular list (NumPy refuses ragged
+        # lists) and gives the bytes for free. We chose unsigned char 8 (range from 0 to 255) so each x or y coordinates
+        # can be store on 1 byte
+        try:
+            commands_array = np.asarray(commands, dtype=np.uint8)
+        except ValueError as e:
+            raise ValueError("Command must be a rectangular list.") from e
+        if commands_array.ndim != 2:
+            raise ValueError("Command must be a rectangular list.")
+
+        return _request_header_struct.pack(commands_array.size) + commands_array.tobytes()
 
     @property
     def serialized(self) -> bytes:
-        return self._commands_lengths + self._commands_as_bytes
+        return self._serialized
 
 
-class TcpResponseProtocol:
-    @classproperty
-    def header_length(cls) -> int:
-        return 4
+_full_table_serialized = TcpRequestProtocol._serialize(_full_table_commands)
 
-    @classproperty
-    def _data_shape(cls) -> tuple[int, int]:
-        return (-1, 10)
+
+class TcpResponseProtocol:
+    # These are constants of the protocol, so plain class attributes avoid a descriptor call on every access
+    header_length: int = _response_header_struct.size
+    _data_shape: tuple[int, int] = (-1, 10)
 
     @staticmethod
-    def get_data_length_from_header(header_data: bytes) -> int:
+    def get_data_length_from_header(header_data: bytes | bytearray | memoryview) -> int:
         if len(header_data) != TcpResponseProtocol.header_length:
             raise ValueError("Header data length does not match expected header length.")
 
-        return struct.unpack("!i", header_data)[0] * 8  # each double is 8 bytes
+        return _response_header_struct.unpack_from(header_data, 0)[0] * 8  # each double is 8 bytes
 
     @staticmethod
-    def deserialize(data: bytes) -> np.ndarray:
-        data_length = len(data) // 8
-
-        # Unpack double in network standard (Big endian)
-        return np.reshape(struct.unpack(f"!{data_length}d", data), TcpResponseProtocol._data_shape).T
+    def deserialize(data: bytes | bytearray | memoryview) -> np.ndarray:
+        """
+        Deserialize the payload of a response. Any buffer-like object is accepted (e.g. a view over a receive buffer), no
+        intermediate copy is made before the conversion, and the returned array does not reference data.
+        """
+        # Interpret the payload as doubles in network standard (Big endian) and convert them to native in a single pass
+        values = np.frombuffer(data, dtype=_response_data_type).astype(np.float64)
+        return np.reshape(values, TcpResponseProtocol._data_shape).T
@@ -51,15 +51,14 @@ double channel_N                // 8 bytes (N = channel_count requested by clien
 """
 
 from enum import Enum
-import json
 import logging
 import struct
-from typing import Iterable, Tuple
+from typing import Iterable, Sequence, Tuple
 
 import numpy as np
 
 from .generic_communication_protocol import GenericRequestProtocol
-
+from ..misc import json_dumps
 
 _logger = logging.getLogger(__name__)
 
@@ -75,11 +74,30 @@ class UdpProtocolConstants:
 
     # Control header (TCP): magic_code(2), version(2), operational code(2), payload_len(4)
     control_header_format = "!H H H I"
-    control_header_len = struct.calcsize(control_header_format)
+    control_header_struct = struct.Struct(control_header_format)  # Precompiled, to avoid parsing the format each time
+    control_header_len = control_header_struct.size
 
     # Data frame header (UDP): magic_code(2), version(2), sequence_id(4), sample_count(2), channel_count(2)
     data_header_format = "!H H I H H"
-    data_header_len = struct.calcsize(data_header_format)
+    data_header_struct = struct.Struct(data_header_format)  # Precompiled, to avoid parsing the format each time
+    data_header_len = data_header_struct.size
+    # A valid data frame always starts with the same magic code and version, so the beginning of the header can be
+    # checked as raw bytes and only the rest of it needs to be unpacked
+    data_header_prefix = struct.pack("!H H", data_magic_code, data_version)
+    data_header_rest_struct = struct.Struct("!I H H")
+    # The same header as a NumPy record, so the headers of a batch of packets can be validated all at once
+    data_header_dtype = np.dtype(
+        [
+            ("magic_code", ">u2"),
+            ("version", ">u2"),
+            ("sequence_id", ">u4"),
+            ("sample_count", ">u2"),
+            ("channel_count", ">u2"),
+        ]
+    )
+
+    # Data frame payload: doubles in network standard (Big endian)
+    data_dtype = np.dtype(">f8")
 
     # Operational codes for control messages
     class OperationalCode(Enum):
@@ -93,27 +111,33 @@ class UdpProtocolConstants:
 
 
 class UdpRequestProtocol(GenericRequestProtocol):
-    pass
+    @staticmethod
+    def _serialize(operational_code: UdpProtocolConstants.OperationalCode, content: dict) -> bytes:
+        """
+        Serialize a control message, that is the control header followed by the json-encoded content
+        """
+        payload = json_dumps(content)
+
+        header = UdpProtocolConstants.control_header_struct.pack(
+            UdpProtocolConstants.control_magic_code,
+            UdpProtocolConstants.control_version,
+            operational_code.value,
+            len(payload),
+        )
+
+        return header + payload
 
 
 class UdpCommandProtocol(UdpRequestProtocol):
     def __init__(self, operational_code: UdpProtocolConstants.OperationalCode):
         self._operational_code = operational_code
 
+        # The request is immutable, so it can be serialized once and for all
+        self._serialized = UdpRequestProtocol._serialize(self._operational_code, {})
+
     @property
     def serialized(self) -> bytes:
-        command = {}
-        payload = json.dumps(command).encode("utf-8")
-
-        header = struct.pack(
-            UdpProtocolConstants.control_header_format,
-            UdpProtocolConstants.control_magic_code,
-            UdpProtocolConstants.control_version,
-            self._operational_code.value,
-            len(payload),
-        )
-
-        return header + payload
+        return self._serialized
 
 
 class UdpConfigurationProtocol(UdpRequestProtocol):
@@ -177,29 +201,38 @@ class UdpConfigurationProtocol(UdpRequestProtocol):
             channels = [channels]
         self._channels = list(channels)
 
-    @property
-    def serialized(self) -> bytes:
+        # The request is immutable, so it can be serialized once and for all
         configuration = {
             "channels": [channel.value for channel in self._channels],
             "frequency": None,
             "sample_per_block": None,
         }
-        payload = json.dumps(configuration).encode("utf-8")
-
-        header = struct.pack(
-            UdpProtocolConstants.control_header_format,
-            UdpProtocolConstants.control_magic_code,
-            UdpProtocolConstants.control_version,
-            UdpProtocolConstants.OperationalCode.SET_CONFIG.value,
-            len(payload),
-        )
+        self._serialized = UdpRequestProtocol._serialize(UdpProtocolConstants.OperationalCode.SET_CONFIG, configuration)
 
-        return header + payload
+    @property
+    def serialized(self) -> bytes:
+        return self._serialized
 
 
 class UdpResponseProtocol:
     @staticmethod
-    def deserialize(data: bytes, previous_sequence_id: int = None) -> Tuple[np.ndarray | None, int]:
+    def deserialize(
+        data: bytes | bytearray | memoryview, previous_sequence_id: int = None, copy: bool = True
+    ) -> Tuple[np.ndarray | None, int]:
+        """
+        Deserialize a data packet. Any buffer-like object is accepted (e.g. a memoryview over a receive buffer) and it is
+        never sliced, so no intermediate copy of the payload is made.
+
+        Parameters:
+            data: The data packet (header followed by the payload)
+            previous_sequence_id: The sequence id of the last accepted packet, to drop the duplicated and out of order ones
+            copy: If True, the samples are converted to a new native array. If False, a big endian view over data is
+                returned instead, which is only valid as long as data is not modified
+
+        Returns:
+            Tuple[np.ndarray | None, int]: The samples (None if the packet is dropped) and the sequence id of the last
+                accepted packet
+        """
         if previous_sequence_id is None:
             previous_sequence_id = -1
 
@@ -208,28 +241,132 @@ class UdpResponseProtocol:
             return None, previous_sequence_id
 
         # parse header
-        data_hdr = data[: UdpProtocolConstants.data_header_len]
-        (magic, ver, sequence_id, sample_count, channel_count) = struct.unpack(
-            UdpProtocolConstants.data_header_format, data_hdr
-        )
-        if magic != UdpProtocolConstants.data_magic_code and ver != UdpProtocolConstants.data_version:
+        if data[: len(UdpProtocolConstants.data_header_prefix)] != UdpProtocolConstants.data_header_prefix:
             _logger.warning("Bad data magic")
             return None, previous_sequence_id
+        sequence_id, sample_count, channel_count = UdpProtocolConstants.data_header_rest_struct.unpack_from(
+            data, len(UdpProtocolConstants.data_header_prefix)
+        )
 
-        payload = data[UdpProtocolConstants.data_header_len :]
+        payload_len = len(data) - UdpProtocolConstants.data_header_len
         expected_doubles = sample_count * channel_count
-        if len(payload) < expected_doubles * 8:
-            _logger.warning(f"Incomplete payload: got {len(payload)} expected {expected_doubles*8}")
+        if payload_len < expected_doubles * 8:
+            _logger.warning("Incomplete payload: got %d expected %d", payload_len, expected_doubles * 8)
             return None, previous_sequence_id
 
         if previous_sequence_id > sequence_id:
-            _logger.warning(f"Out of order packet: got {sequence_id} expected > {previous_sequence_id}")
+            _logger.warning("Out of order packet: got %d expected > %d", sequence_id, previous_sequence_id)
             return None, previous_sequence_id
         if previous_sequence_id == sequence_id:
             # duplicate packet
             return None, previous_sequence_id
 
-        # unpack all doubles
-        fmt = f"!{expected_doubles}d"
-        values = struct.unpack(fmt, payload[: expected_doubles * 8])
-        return np.array(values, dtype=np.float64).reshape((sample_count, channel_count)), sequence_id
+        # Interpret all the doubles in network standard (Big endian) directly after the header, without slicing the
+        # payload out of data, and convert them to native in a single pass. The conversion copies, so the returned array
+        # does not alias data and the receive buffer can be reused right away
+        values = np.ndarray(
+            (sample_count, channel_count),
+            dtype=UdpProtocolConstants.data_dtype,
+            buffer=data,
+            offset=UdpProtocolConstants.data_header_len,
+        )
+        return (values.astype(np.float64) if copy else values), sequence_id
+
+    @staticmethod
+    def deserialize_many(
+        buffer: bytes | bytearray | memoryview,
+        packet_lens: Sequence[int],
+        packet_stride: int,
+        previous_sequence_id: int = None,
+    ) -> Tuple[np.ndarray | None, int]:
+        """
+        Deserialize a batch of data packets (in the order they were received) into a single array. The packets are
+        stored one after the other at a fixed stride in buffer, that is the i-th packet starts at i * packet_stride and
+        is packet_lens[i] bytes long. This is equivalent to calling deserialize on each packet and concatenating the
+        results, but the headers of the batch are read in a single call and its payloads are converted to native doubles
+        in a single pass.
+
+        Returns:
+            Tuple[np.ndarray | None, int]: The samples of all the accepted packets (None if no packet was accepted) and
+                the sequence id of the last accepted packet
+        """
+        if previous_sequence_id is None:
+            previous_sequence_id = -1
+        packet_count = len(packet_lens)
+        if packet_count == 0:
+            return None, previous_sequence_id
+
+        # The headers are read in place, as a strided view of records over the buffer, and validated in a single pass.
+        # The header of a packet that is too short is garbage, but it is rejected before being looked at
+        header_len = UdpProtocolConstants.data_header_len
+        headers = np.ndarray(
+            (packet_count,), dtype=UdpProtocolConstants.data_header_dtype, buffer=buffer, strides=(packet_stride,)
+        ).tolist()
+
+        accepted_indices = []
+        lost_packet_count = 0
+        for index, (packet_len, header) in enumerate(zip(packet_lens, headers)):
+            magic_code, version, sequence_id, sample_count, channel_count = header
+            if packet_len < header_len:
+                _logger.warning("Short data packet")
+                continue
+            if magic_code != UdpProtocolConstants.data_magic_code or version != UdpProtocolConstants.data_version:
+                _logger.warning("Bad data magic")
+                continue
+            if packet_len - header_len < sample_count * channel_count * 8:
+                _logger.warning(
+                    "Incomplete payload: got %d expected %d", packet_len - header_len, sample_count * channel_count * 8
+                )
+                continue
+            if previous_sequence_id > sequence_id:
+                _logger.warning("Out of order packet: got %d expected > %d", sequence_id, previous_sequence_id)
+                continue
+            if previous_sequence_id == sequence_id:
+                # duplicate packet
+                continue
+
+            if previous_sequence_id >= 0:
+                lost_packet_count += sequence_id - previous_sequence_id - 1
+            previous_sequence_id = sequence_id
+            accepted_indices.append(index)
+
+        if lost_packet_count > 0:
+            _logger.warning("Lost %d packets", lost_packet_count)
+        if not accepted_indices:
+            return None, previous_sequence_id
+
+        # Frames of different shapes cannot be stacked, so only keep the ones that follow the latest configuration
+        channel_count = headers[accepted_indices[-1]][4]
+        if any(headers[index][4] != channel_count for index in accepted_indices):
+            _logger.warning("Inconsistent channel count in a batch of packets, keeping the latest ones")
+            accepted_indices = [index for index in accepted_indices if headers[index][4] == channel_count]
+
+        sample_count = headers[accepted_indices[0]][3]
+        if all(headers[index][3] == sample_count for index in accepted_indices):
+            # All the frames have the same shape, so the payloads of the batch form a single strided view over the
+            # buffer, which is converted from big endian in one pass (there is no need to convert each frame and then
+            # copy them all again to concatenate them)
+            payloads = np.ndarray(
+                (packet_count, sample_count, channel_count),
+                dtype=UdpProtocolConstants.data_dtype,
+                buffer=buffer,
+                offset=header_len,
+                strides=(packet_stride, channel_count * 8, 8),
+            )
+            if len(accepted_indices) != packet_count:
+                payloads = payloads[accepted_indices]
+            return payloads.astype(np.float64).reshape((-1, channel_count)), previous_sequence_id
+
+        # Otherwise, convert each payload straight into its final place in the output
+        data = np.empty((sum(headers[index][3] for index in accepted_indices), channel_count), dtype=np.float64)
+        row = 0
+        for index in accepted_indices:
+            sample_count = headers[index][3]
+            data[row : row + sample_count, :] = np.ndarray(
+                (sample_count, channel_count),
+                dtype=UdpProtocolConstants.data_dtype,
+                buffer=buffer,
+                offset=index * packet_stride + header_len,
+            )
+            row += sample_count
+        return data, previous_sequence_id
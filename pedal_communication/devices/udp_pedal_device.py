@@ -1,9 +1,12 @@
 import logging
+import os
+import select
+import selectors
 import socket
-import struct
+import sys
 import time
 import threading
-from typing import Tuple
+from typing import Iterable, Iterator, Tuple
 
 import numpy as np
 
@@ -16,29 +19,81 @@ from .udp_communication_protocol import (
     UdpConfigurationProtocol,
 )
 from ..misc import recv_exact
+from ..misc.datagram_receiver import DatagramBatchReceiver, enable_drop_counter
 
-_logger = logging.getLogger("ClientExample")
+_logger = logging.getLogger(__name__)
 
 
-def parse_control_header(data: bytes):
-    return struct.unpack(UdpProtocolConstants.control_header_format, data)
+def parse_control_header(data: bytes | bytearray | memoryview):
+    return UdpProtocolConstants.control_header_struct.unpack_from(data)
 
 
 class UdpPedalDevice(GenericDevice):
-    def __init__(self, _host: str = "localhost", control_port: int = 6000, data_port: int = 5999, *args, **kwargs):
-
+    # Largest possible UDP datagram, hence the size of the slot each datagram is received in
+    _datagram_max_len = 65536
+    # Number of batches of frames the listener can get ahead of the consumer before the oldest ones are dropped (must be
+    # a power of two)
+    _data_ring_capacity = 64
+    # Time (in seconds) to wait for the response to a command, so a device that stops answering does not block forever
+    _control_response_timeout = 2.0
+
+    def __init__(
+        self,
+        _host: str = "localhost",
+        control_port: int = 6000,
+        data_port: int = 5999,
+        data_batch_size: int = 32,
+        data_socket_buffer_size: int = 8 * 1024 * 1024,
+        data_thread_cpu: int | None = None,
+        data_thread_niceness_increment: int | None = None,
+        *args,
+        **kwargs,
+    ):
+        """
+        Parameters:
+            _host: The address of the device
+            control_port: The TCP port the commands are sent to
+            data_port: The UDP port the data are received on
+            data_batch_size: The maximum number of datagrams received at once
+            data_socket_buffer_size: The size (in bytes) of the receive buffer of the data socket
+            data_thread_cpu: The CPU to pin the listener thread to (Linux only), None to leave it to the system
+            data_thread_niceness_increment: The os.nice increment of the listener thread (Linux only), None to keep it
+        """
         super().__init__(*args, **kwargs)
         self._host = _host
         self._control_port = control_port
         self._data_port = data_port
+        # A large receive buffer absorbs the bursts of datagrams that arrive while the listener is stalled (GIL, GC...)
+        self._data_socket_buffer_size = data_socket_buffer_size
+        self._data_thread_cpu = data_thread_cpu
+        self._data_thread_niceness_increment = data_thread_niceness_increment
 
         self._control_socket: socket.socket = None
+        # The responses are waited for with this selector, which gives them a timeout without making the socket
+        # non-blocking or changing its timeout
+        self._control_selector: selectors.BaseSelector = None
         self._data_socket: socket.socket = None
         self._should_auto_reconnect = False
-
-        self._data_last_received: np.ndarray = None
+        # Set while connected, so the listener can sleep until a connection is made instead of polling for it. The count
+        # tells the listener that a new connection was made (and so the sequence ids restarted)
+        self._connected_event = threading.Event()
+        self._connection_count = 0
+
+        # The frames are handed from the listener thread (single producer) to get_last_data (single consumer) through a
+        # ring of slots. Only the listener writes the head and only the consumer writes the tail, so no lock is needed:
+        # rebinding a slot or an int attribute is atomic under the GIL, and the slot is written before the head moves
+        self._data_ring: list[np.ndarray | None] = [None] * UdpPedalDevice._data_ring_capacity
+        self._data_ring_head = 0
+        self._data_ring_tail = 0
+        # Datagrams are received in place in these buffers (up to one batch of datagrams per wake up), instead of
+        # allocating a new bytes object for each of them. They are stored one after the other in a single buffer, at a
+        # fixed stride, so a whole batch can be deserialized at once
+        self._data_receive_buffer = bytearray(data_batch_size * UdpPedalDevice._datagram_max_len)
+        self._data_receiver = DatagramBatchReceiver(self._data_receive_buffer, UdpPedalDevice._datagram_max_len)
+        self._has_pending_data_packets = False
+        self._data_ready_event = threading.Event()
         self._data_stop_event = threading.Event()
-        self._data_thread = threading.Thread(target=self._listen_udp_data, daemon=True)
+        self._data_thread = threading.Thread(target=self._listen_udp_data, name="pedal-udp-rx", daemon=True)
         self._data_thread.start()
 
     @property
@@ -57,48 +112,73 @@ class UdpPedalDevice(GenericDevice):
         return self._control_port
 
     def connect(self) -> bool:
-        _logger.debug(f"Attempting to connect to TCP device at {self._host}:{self._control_port}")
+        _logger.debug("Attempting to connect to TCP device at %s:%d", self._host, self._control_port)
         if self.is_connected:
             _logger.debug("Already connected to TCP device.")
             return True  # Already connected
 
         # 1) Connect TCP control channel
         self._control_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # The control messages are small and each one waits for its response, so do not let Nagle's algorithm hold them
+        self._control_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         try:
             self._control_socket.connect((self._host, self._control_port))
         except socket.error:
             _logger.error(f"Failed to connect to TCP device at {self._host}:{self._control_port}")
             self._control_socket = None
             return
+        self._control_selector = selectors.DefaultSelector()
+        self._control_selector.register(self._control_socket, selectors.EVENT_READ)
 
         # 2) Open UDP socket to receive data
         self._data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._data_socket.settimeout(0.1)
+        self._data_socket.setblocking(False)  # Waiting for data is done in _receive_data_packets
+        self._data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self._data_socket_buffer_size)
+        effective_buffer_size = self._data_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if effective_buffer_size < self._data_socket_buffer_size:
+            # Linux reports twice the size it actually uses, and caps it to net.core.rmem_max
+            _logger.info(
+                "UDP receive buffer is %d bytes instead of %d, consider raising net.core.rmem_max",
+                effective_buffer_size,
+                self._data_socket_buffer_size,
+            )
+        enable_drop_counter(self._data_socket)
         self._data_socket.sendto(b"", (self._host, self._data_port))
 
         # 3) Send SET_CONFIG (tell server frequency, channels, which UDP port to stream to, note this is optional
-        # for "all channels" as it is the default value)
-        is_success, _ = self.send(UdpConfigurationProtocol(channels=None))  # All channels
-        if not is_success:
+        # for "all channels" as it is the default value), and 4) request START streaming. Both are sent in a single
+        # write so it costs one round trip instead of two
+        (is_config_success, _), (is_start_success, _) = self.send_many(
+            [
+                UdpConfigurationProtocol(channels=None),  # All channels
+                UdpCommandProtocol(UdpProtocolConstants.OperationalCode.START),
+            ]
+        )
+        if not is_config_success:
             _logger.error("Failed to send configuration to UDP device.")
             self.disconnect()
             return False
 
-        # 4) Request START streaming
-        is_success, _ = self.send(UdpCommandProtocol(UdpProtocolConstants.OperationalCode.START))
-        if not is_success:
+        if not is_start_success:
             _logger.error("Failed to start streaming from UDP device.")
             self.disconnect()
             return False
 
         self._should_auto_reconnect = True
+        self._connection_count += 1
+        self._connected_event.set()
         _logger.info(f"Successfully connected to UDP device at {self._host}:{self._control_port}")
         return True
 
     def disconnect(self) -> bool:
-        _logger.debug(f"Disconnecting from {self._host}")
+        _logger.debug("Disconnecting from %s", self._host)
+        self._connected_event.clear()
         self.send(UdpCommandProtocol(UdpProtocolConstants.OperationalCode.STOP))
 
+        if self._control_selector is not None:
+            self._control_selector.close()
+            self._control_selector = None
+
         if self._control_socket is not None:
             self._control_socket.close()
             self._control_socket = None
@@ -113,83 +193,218 @@ class UdpPedalDevice(GenericDevice):
         """
         Terminate the current object and release all associated resources. Once disposed, the object cannot be used anymore.
         """
-        self.disconnect()
-
+        # Stop the listener first, so it does not reconnect in between, and wake it up if it is waiting for a connection
+        self._data_stop_event.set()
+        self._connected_event.set()
         if self._data_thread.is_alive():
-            self._data_stop_event.set()
             self._data_thread.join()
 
+        self.disconnect()
+
     def send(self, command: UdpRequestProtocol) -> Tuple[bool, bytes]:
+        return self.send_many([command])[0]
+
+    def send_many(self, commands: Iterable[UdpRequestProtocol]) -> list[Tuple[bool, bytes]]:
+        """
+        Send several commands to the device in a single write, then read their responses (in the same order).
+
+        Returns:
+            list[Tuple[bool, bytes]]: For each command, whether it was acknowledged and the payload of the response.
+        """
+        commands = list(commands)
         if not self.is_connected:
-            return False
+            return [(False, b"")] * len(commands)
 
         try:
-            self._control_socket.sendall(command.serialized)
+            self._control_socket.sendall(b"".join(command.serialized for command in commands))
         except socket.error:
-            return False
+            return [(False, b"")] * len(commands)
 
-        return self._parse_command_response()
+        return [self._parse_command_response() for _ in commands]
 
-    def _parse_command_response(self) -> Tuple[bool, bytes] | bool:
+    def _parse_command_response(self) -> Tuple[bool, bytes]:
         # read response
         try:
-            header = recv_exact(self._control_socket, UdpProtocolConstants.control_header_len)
-            magic, version, operational_code, payload_len = struct.unpack(
-                UdpProtocolConstants.control_header_format, header
+            header = recv_exact(
+                self._control_socket,
+                UdpProtocolConstants.control_header_len,
+                selector=self._control_selector,
+                timeout=UdpPedalDevice._control_response_timeout,
             )
-            # Sanity check
-            if magic != UdpProtocolConstants.control_magic_code or version != UdpProtocolConstants.control_version:
-                _logger.error(f"Unsupported control protocol version: {version}")
-                return False
-
-            # Get the payload (empty string if payload_len == 0)
-            payload = recv_exact(self._control_socket, payload_len)
-            _logger.info(f"SET_CONFIG response opcode={operational_code} payload={payload}")
+        except OSError:  # Includes ConnectionError and TimeoutError
+            return False, b""
+        magic, version, operational_code, payload_len = parse_control_header(header)
+        # Sanity check
+        if magic != UdpProtocolConstants.control_magic_code or version != UdpProtocolConstants.control_version:
+            _logger.error(f"Unsupported control protocol version: {version}")
+            return False, b""
 
-            return operational_code == UdpProtocolConstants.OperationalCode.ACK.value, payload
-        except:
+        # Get the payload (empty string if payload_len == 0)
+        try:
+            payload = recv_exact(
+                self._control_socket,
+                payload_len,
+                selector=self._control_selector,
+                timeout=UdpPedalDevice._control_response_timeout,
+            )
+        except OSError:
             return False, b""
+        _logger.info("SET_CONFIG response opcode=%d payload=%s", operational_code, payload)
+
+        return operational_code == UdpProtocolConstants.OperationalCode.ACK.value, payload
+
+    def _set_listener_scheduling(self) -> None:
+        """
+        Apply the scheduling requested for the listener thread to the calling thread (Linux only).
+        """
+        # Pinning the listener keeps its data in the caches of one core, and a negative niceness increment schedules it
+        # ahead of the other busy threads (which requires CAP_SYS_NICE). Both only apply to the calling thread on Linux
+        if not sys.platform.startswith("linux"):
+            return
+
+        if self._data_thread_cpu is not None:
+            try:
+                os.sched_setaffinity(0, {self._data_thread_cpu})
+            except OSError as e:
+                _logger.warning("Could not pin the UDP listener thread to CPU %s: %s", self._data_thread_cpu, e)
+
+        if self._data_thread_niceness_increment is not None:
+            try:
+                os.nice(self._data_thread_niceness_increment)
+            except PermissionError:
+                _logger.warning("Not allowed to raise the priority of the UDP listener thread (requires CAP_SYS_NICE).")
 
     def _listen_udp_data(self) -> None:
         """
-        Main loop that listens to UDP data packets from the device. It is designed to run in a separate thread, but to
-        update the data in the main thread. This is currently NOT thread-safe and could be improved in the future.
+        Main loop that listens to UDP data packets from the device. It is designed to run in a separate thread, the
+        frames are handed to get_last_data through a single-producer single-consumer ring (see _publish_data).
         """
 
+        self._set_listener_scheduling()
+        connection_count = self._connection_count
         previous_sequence_id = None
         last_data_received_time = time.time()
         while not self._data_stop_event.is_set():
             try:
                 if not self.is_connected:
-                    if not self._should_auto_reconnect or not self.connect():
-                        time.sleep(0.1)
+                    if not self._should_auto_reconnect:
+                        # Sleep until connect is called (or the device is disposed)
+                        self._connected_event.wait(timeout=1.0)
                         continue
+                    if not self.connect():
+                        self._data_stop_event.wait(timeout=0.1)
+                        continue
+
+                if connection_count != self._connection_count:
+                    # A new connection was made, the device restarted its sequence
+                    connection_count = self._connection_count
                     previous_sequence_id = None
                     last_data_received_time = time.time()
 
-                data_packets, _ = self._data_socket.recvfrom(65536)
+                packet_lens = self._receive_data_packets()
+                if not packet_lens:
+                    if time.time() - last_data_received_time >= 1:  # 1 second without data
+                        _logger.warning("No UDP data received for 1 second, disconnecting...")
+                        self.disconnect()
+                    continue
                 last_data_received_time = time.time()
 
-                data, previous_sequence_id = UdpResponseProtocol.deserialize(
-                    data_packets, previous_sequence_id=previous_sequence_id
+                # The deserialization copies the data, so the buffers can be reused for the next batch
+                data, previous_sequence_id = UdpResponseProtocol.deserialize_many(
+                    self._data_receive_buffer,
+                    packet_lens,
+                    UdpPedalDevice._datagram_max_len,
+                    previous_sequence_id=previous_sequence_id,
                 )
                 if data is not None:
-                    self._data_last_received = data
-
-            except socket.timeout:
-                if time.time() - last_data_received_time >= 1:  # 1 second without data
-                    _logger.warning("No UDP data received for 1 second, disconnecting...")
-                    self.disconnect()
+                    self._publish_data(data)
 
-            except Exception as e:
-                _logger.debug(f"No UDP data received: {e}")
-                pass
+            except (OSError, ValueError) as e:
+                # The sockets may be closed by another thread while waiting on them (select raises ValueError on a
+                # closed socket), which is expected when disconnecting
+                _logger.debug("No UDP data received: %s", e)
+            except Exception:
+                _logger.exception("Unexpected error in the UDP data listener")
 
         _logger.info("UDP data listener thread exiting")
 
-    def get_last_data(self) -> np.ndarray | None:
-        if not self.is_connected or self._data_last_received is None:
+    def _receive_data_packets(self, timeout: float = 0.1) -> list[int]:
+        """
+        Wait up to `timeout` seconds for datagrams, then receive all the ones already queued (up to the batch size) so
+        the thread only wakes up once per burst of datagrams. The i-th datagram is received in the i-th slot of the
+        receive buffer.
+
+        Returns:
+            list[int]: The length of the received datagrams, valid until the next call (empty if none arrived)
+        """
+        # If the previous call filled the whole batch, more datagrams are most likely already queued, so there is no
+        # need to wait for them
+        data_socket = self._data_socket  # It may be reset by disconnect in another thread
+        if data_socket is None:
+            return []
+        if not self._has_pending_data_packets:
+            ready_sockets, _, _ = select.select([data_socket], [], [], timeout)
+            if not ready_sockets:
+                return []
+
+        dropped_count = self._data_receiver.dropped_count
+        packet_lens = self._data_receiver.receive(data_socket)
+        if self._data_receiver.dropped_count > dropped_count:
+            _logger.warning(
+                "The kernel dropped %d datagrams, the UDP receive buffer is full",
+                self._data_receiver.dropped_count - dropped_count,
+            )
+        self._has_pending_data_packets = len(packet_lens) == self._data_receiver.slot_count
+        return packet_lens
+
+    def _publish_data(self, data: np.ndarray) -> None:
+        """
+        Hand a batch of frames to the consumer. This must only be called from the listener thread.
+        """
+        head = self._data_ring_head
+        self._data_ring[head & (UdpPedalDevice._data_ring_capacity - 1)] = data
+        self._data_ring_head = head + 1
+        self._data_ready_event.set()
+
+    def get_last_data(self, timeout: float = 0.1) -> np.ndarray | None:
+        """
+        Get all the data frames received from the device since the previous call, waiting up to `timeout` seconds for a
+        new one to arrive.
+        """
+        frames = self._take_pending_data(timeout)
+        if not frames:
             return None
-        data = self._data_last_received
-        self._data_last_received = None
-        return data
+        return frames[0] if len(frames) == 1 else np.concatenate(frames, axis=0)
+
+    def iter_frames(self, timeout: float = 0.1) -> Iterator[np.ndarray]:
+        """
+        Iterate over the batches of data frames received from the device since the previous call (or call to
+        get_last_data), waiting up to `timeout` seconds for a new one to arrive. Contrary to get_last_data, the batches
+        are not concatenated, so no copy is made. Each batch was allocated for the consumer alone, so it can be kept
+        without copying it as the listener never writes to it again.
+        """
+        yield from self._take_pending_data(timeout)
+
+    def _take_pending_data(self, timeout: float) -> list[np.ndarray]:
+        """
+        Take the batches of frames waiting in the ring, waiting up to `timeout` seconds if there are none. This must only
+        be called from the consumer thread.
+        """
+        # Clear before looking at the ring, so a frame published in between sets the event again instead of being missed
+        self._data_ready_event.clear()
+        if self._data_ring_head == self._data_ring_tail and not self._data_ready_event.wait(timeout=timeout):
+            return []
+
+        head = self._data_ring_head
+        tail = self._data_ring_tail
+        if head - tail > UdpPedalDevice._data_ring_capacity:
+            _logger.warning(
+                "Data consumer is too slow, dropped %d batches", head - tail - UdpPedalDevice._data_ring_capacity
+            )
+            tail = head - UdpPedalDevice._data_ring_capacity
+        frames = [self._data_ring[i & (UdpPedalDevice._data_ring_capacity - 1)] for i in range(tail, head)]
+        self._data_ring_tail = head
+
+        if not self.is_connected:
+            return []
+        return frames
@@ -1,4 +1,13 @@
+import selectors
 import socket
+import time
+
+# orjson is an optional dependency, it is much faster than the standard library when available
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+    import json as _json
 
 
 class classproperty(property):
@@ -6,18 +15,112 @@ class classproperty(property):
         return classmethod(self.fget).__get__(None, owner)()
 
 
-def recv_exact(socket: socket.socket, data_len: int) -> bytes:
+def json_dumps(content) -> bytes:
+    """
+    Encode content to utf-8 json bytes, using orjson if it is installed and the standard library otherwise.
+    """
+    if _orjson is not None:
+        return _orjson.dumps(content)
+    return _json.dumps(content).encode("utf-8")
+
+
+def json_loads(data: bytes | bytearray | memoryview | str):
+    """
+    Decode utf-8 json bytes, using orjson if it is installed and the standard library otherwise.
+    """
+    if _orjson is not None:
+        return _orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return _json.loads(data)
+
+
+def recv_exact(
+    socket: socket.socket, data_len: int, selector: selectors.BaseSelector | None = None, timeout: float | None = None
+) -> bytes:
     """
     Read exactly n bytes from a socket. Raises ConnectionError on EOF.
     This handles the fact that socket.recv(n) may return fewer bytes.
+
+    Parameters:
+        socket: The socket to read from
+        data_len: The number of bytes to read
+        selector: A selector the socket is registered to (for reading). If provided, it is used to wait for the data
+            instead of blocking in recv, so the read can be given a timeout without changing the timeout of the socket
+        timeout: The maximum time (in seconds) to wait for the whole data when a selector is provided, None waiting
+            forever. Raises TimeoutError when it elapses (the data received so far are lost)
     """
     if data_len <= 0:
         return b""
 
-    buf = b""
-    while len(buf) < data_len:
-        chunk = socket.recv(data_len - len(buf))
-        if not chunk:
+    deadline = None if selector is None or timeout is None else time.monotonic() + timeout
+
+    # Most of the time, everything is already there and a single recv is enough
+    _wait_readable(selector, deadline)
+    chunk = socket.recv(data_len)
+    if not chunk:
+        raise ConnectionError("Connection closed while reading")
+    if len(chunk) == data_len:
+        return chunk
+
+    # Otherwise, receive the rest in place instead of concatenating the chunks (which copies the data over and over)
+    buf = bytearray(data_len)
+    buf[: len(chunk)] = chunk
+    view = memoryview(buf)
+    received = len(chunk)
+    while received < data_len:
+        _wait_readable(selector, deadline)
+        chunk_len = socket.recv_into(view[received:], data_len - received)
+        if not chunk_len:
+            raise ConnectionError("Connection closed while reading")
+        received += chunk_len
+    return bytes(buf)
+
+
+def _wait_readable(selector: selectors.BaseSelector | None, deadline: float | None) -> None:
+    """
+    Wait until the socket registered to the selector can be read, up to the deadline (time.monotonic() time). This
+    returns immediately if there is no selector.
+    """
+    if selector is None:
+        return
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    if not selector.select(timeout):
+        raise TimeoutError("Timed out while reading")
+
+
+def recv_exact_into(socket: socket.socket, buffer: bytearray, data_len: int) -> memoryview:
+    """
+    Read exactly n bytes from a socket into a pre-allocated buffer (which must be at least data_len long) and return
+    a view over the received bytes. Raises ConnectionError on EOF. Contrary to recv_exact, no intermediate bytes
+    objects are created, but the returned view is only valid until the buffer is written to again.
+    """
+    view = memoryview(buffer)
+    received = 0
+    while received < data_len:
+        chunk_len = socket.recv_into(view[received:data_len], data_len - received)
+        if not chunk_len:
             raise ConnectionError("Connection closed while reading")
-        buf += chunk
-    return buf
+        received += chunk_len
+    return view[:data_len]
+
+
+def sendall_buffers(socket: socket.socket, buffers: list[bytes | bytearray | memoryview]) -> None:
+    """
+    Send all the buffers one after the other, as sendall would do with their concatenation, but without building it.
+    Where sendmsg is available, the buffers are handed to the kernel at once (scatter/gather), otherwise they are
+    concatenated and sent with sendall.
+    """
+    if not hasattr(socket, "sendmsg"):
+        socket.sendall(b"".join(buffers))
+        return
+
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+    while views:
+        sent_len = socket.sendmsg(views)
+        # On a partial send, skip what was sent and send the rest
+        while views and sent_len >= len(views[0]):
+            sent_len -= len(views[0])
+            views.pop(0)
+        if views and sent_len:
+            views[0] = views[0][sent_len:]
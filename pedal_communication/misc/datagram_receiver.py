@@ -0,0 +1,172 @@
+import ctypes
+import ctypes.util
+import errno
+import socket
+import sys
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IoVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+class _CMsgHdr(ctypes.Structure):
+    _fields_ = [("cmsg_len", ctypes.c_size_t), ("cmsg_level", ctypes.c_int), ("cmsg_type", ctypes.c_int)]
+
+
+# Ancillary data of a datagram, when SO_RXQ_OVFL is enabled on the socket: the number of datagrams the kernel dropped
+# because the receive buffer was full (there is no constant for it in the socket module)
+SO_RXQ_OVFL = 40
+_control_len = 32  # Large enough for one cmsghdr holding a uint32
+
+
+def _load_recvmmsg():
+    """
+    Get recvmmsg from the C library, which receives many datagrams in a single system call. It only exists on Linux, and
+    Python has no binding for it, hence the use of ctypes.
+
+    Returns:
+        The recvmmsg function, or None if it is not available on this platform
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+def enable_drop_counter(data_socket: socket.socket) -> bool:
+    """
+    Ask the kernel to attach to each datagram the number of datagrams it dropped so far on this socket, so it can be
+    reported by DatagramBatchReceiver.dropped_count. This is only available on Linux.
+
+    Returns:
+        bool: True if the counter could be enabled
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        data_socket.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+    except OSError:
+        return False
+    return True
+
+
+class DatagramBatchReceiver:
+    """
+    Receive all the datagrams already queued on a socket (up to slot_count of them) without blocking, each in its own
+    slot of a pre-allocated buffer (the i-th datagram is written at i * slot_len). On Linux, the whole batch is received
+    with a single recvmmsg system call, which also reports the kernel drop counter if it is enabled on the socket (see
+    enable_drop_counter). Elsewhere, it falls back to calling recv_into once per datagram, so the socket must be
+    non-blocking.
+    """
+
+    def __init__(self, buffer: bytearray, slot_len: int):
+        if slot_len <= 0 or len(buffer) < slot_len:
+            raise ValueError("The buffer must hold at least one slot.")
+
+        self._buffer = buffer
+        self._slot_len = slot_len
+        self._slot_count = len(buffer) // slot_len
+        self._views = [memoryview(buffer)[i * slot_len : (i + 1) * slot_len] for i in range(self._slot_count)]
+
+        self._dropped_count = 0
+        self._messages = None
+        if _recvmmsg is not None:
+            # The messages point straight into the buffer, so they are built once and reused for every call (the buffer
+            # is exported while they exist, so it cannot be resized under them)
+            self._buffer_as_c_array = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+            buffer_address = ctypes.addressof(self._buffer_as_c_array)
+            self._io_vectors = (_IoVec * self._slot_count)()
+            self._messages = (_MMsgHdr * self._slot_count)()
+            self._controls = (ctypes.c_char * (_control_len * self._slot_count))()
+            controls_address = ctypes.addressof(self._controls)
+            for i in range(self._slot_count):
+                self._io_vectors[i].iov_base = buffer_address + i * slot_len
+                self._io_vectors[i].iov_len = slot_len
+                self._messages[i].msg_hdr.msg_iov = ctypes.pointer(self._io_vectors[i])
+                self._messages[i].msg_hdr.msg_iovlen = 1
+                self._messages[i].msg_hdr.msg_control = controls_address + i * _control_len
+                self._messages[i].msg_hdr.msg_controllen = _control_len
+
+    @property
+    def slot_len(self) -> int:
+        return self._slot_len
+
+    @property
+    def slot_count(self) -> int:
+        return self._slot_count
+
+    @property
+    def dropped_count(self) -> int:
+        """
+        The number of datagrams the kernel dropped on the socket so far (always 0 if the drop counter is not enabled or
+        not supported)
+        """
+        return self._dropped_count
+
+    def receive(self, data_socket: socket.socket) -> list[int]:
+        """
+        Receive the datagrams queued on data_socket.
+
+        Returns:
+            list[int]: The length of the received datagrams (empty if none was queued), the i-th datagram being in the
+                i-th slot of the buffer until the next call
+        """
+        if self._messages is not None:
+            received_count = _recvmmsg(data_socket.fileno(), self._messages, self._slot_count, _MSG_DONTWAIT, None)
+            if received_count < 0:
+                error_code = ctypes.get_errno()
+                if error_code in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return []
+                raise OSError(error_code, f"recvmmsg failed: {errno.errorcode.get(error_code, error_code)}")
+
+            packet_lens = [self._messages[i].msg_len for i in range(received_count)]
+            self._read_dropped_count(received_count - 1)
+            for i in range(received_count):
+                # The kernel overwrites the length of the ancillary data it wrote, so it is reset for the next call
+                self._messages[i].msg_hdr.msg_controllen = _control_len
+            return packet_lens
+
+        packet_lens = []
+        for view in self._views:
+            try:
+                packet_lens.append(data_socket.recv_into(view))
+            except BlockingIOError:
+                break
+        return packet_lens
+
+    def _read_dropped_count(self, index: int) -> None:
+        """
+        Update the drop counter from the ancillary data of the index-th message, if the kernel attached it
+        """
+        if self._messages[index].msg_hdr.msg_controllen < ctypes.sizeof(_CMsgHdr) + 4:
+            return
+        control_address = ctypes.addressof(self._controls) + index * _control_len
+        header = _CMsgHdr.from_address(control_address)
+        if header.cmsg_level == socket.SOL_SOCKET and header.cmsg_type == SO_RXQ_OVFL:
+            self._dropped_count = ctypes.c_uint32.from_address(control_address + ctypes.sizeof(_CMsgHdr)).value
@@ -8,10 +8,11 @@ import numpy as np
 from .pedal_device_mocker import PedalDeviceMocker
 from ..data.data import Data
 from ..devices.tpc_communication_protocol import TcpRequestProtocol
-from ..misc import recv_exact
-
+from ..misc import recv_exact, sendall_buffers
 
 _logger = logging.getLogger(__name__)
+# Both the length of the requests and the length of the responses are sent as a big endian int
+_length_header_struct = struct.Struct("!i")
 
 
 class TcpPedalDeviceMocker(PedalDeviceMocker):
@@ -27,8 +28,19 @@ class TcpPedalDeviceMocker(PedalDeviceMocker):
         self._starting_device_clock = time.time()
         self._frequency = 50  # Hz
         self._time_vector_template = np.arange(0, 10 * 1 / self._frequency, 1 / self._frequency)
+        # Duration covered by one frame, the device clock advances by that much from one frame to the next
+        self._frame_period = len(self._time_vector_template) / self._frequency
+
+        # The frames are generated in place in preallocated buffers, laid out as they are sent (channel by channel, the
+        # time first), so serving data does not allocate
+        self._random_generator = np.random.default_rng()
+        self._frame = np.empty((1 + Data.columns_count, len(self._time_vector_template)), dtype=np.float64)
+        self._frame_big_endian = np.empty(self._frame.shape, dtype=">f8")
+        self._frame_header = _length_header_struct.pack(self._frame.size)
 
         self._request_protocol_cache = TcpRequestProtocol(request_type=TcpRequestProtocol.RequestType.NORMAL)
+        # The commands are compared as they are received (one unsigned byte per coordinate), after the length header
+        self._expected_commands_data = self._request_protocol_cache.serialized[_length_header_struct.size :]
 
     @property
     def is_connected(self) -> bool:
@@ -54,19 +66,17 @@ class TcpPedalDeviceMocker(PedalDeviceMocker):
 
         # Wait synchronously for client commands
         try:
-            int_size = struct.calcsize("!i")
-            commands_length = recv_exact(self._connection, int_size)
+            commands_length = recv_exact(self._connection, _length_header_struct.size)
             if not commands_length:
                 raise Exception("Client disconnected.")
-            commands_length = struct.unpack("!i", commands_length)[0]
+            commands_length = _length_header_struct.unpack(commands_length)[0]
 
             commands_data = recv_exact(self._connection, commands_length)
             if not commands_data:
                 raise Exception("Client disconnected.")
 
-            commands = struct.unpack(f"!{commands_length}b", commands_data)
-            commands = [list(commands[i : i + 2]) for i in range(0, len(commands), 2)]
-            if commands != self._request_protocol_cache._commands:
+            # Comparing the raw bytes is a single memcmp, there is no need to unpack the commands into lists of ints
+            if commands_data != self._expected_commands_data:
                 _logger.info(f"Unexpected commands received")
                 return False
 
@@ -80,22 +90,19 @@ class TcpPedalDeviceMocker(PedalDeviceMocker):
         if not self.is_connected:
             return
 
-        # Create a time vector based on elapsed time
-        time_increments = 1 / self._frequency * len(self._time_vector_template)
-        time_elapsed = time.time() - self._starting_device_clock
-        ratio = time_elapsed // (1 / self._frequency * len(self._time_vector_template))
-        time_vector = self._time_vector_template + ratio * time_increments
+        # Create a time vector based on elapsed time (written in place in the time row of the frame)
+        frame_count = (time.time() - self._starting_device_clock) // self._frame_period
+        np.add(self._time_vector_template, frame_count * self._frame_period, out=self._frame[0, :])
 
-        # Simulate some random data (time_vector length x N channels)
-        data = np.concatenate((time_vector[:, None], np.random.rand(len(time_vector), Data.columns_count)), axis=1)
-        data_bytes = b""
-        for row in data.T:
-            for value in row:
-                data_bytes += struct.pack("!d", value)
+        # Simulate some random data (N channels x time_vector length)
+        self._random_generator.random(out=self._frame[1:, :])
 
-        data_length = struct.pack("!i", data.shape[0] * data.shape[1])
+        # The response is sent channel by channel, as doubles in network standard (Big endian). The cast writes the
+        # frame in that layout in a single pass, instead of packing each value separately
+        np.copyto(self._frame_big_endian, self._frame)
         try:
-            self._connection.sendall(data_length + data_bytes)
+            # The header and the frame are sent straight from their buffers, without concatenating them
+            sendall_buffers(self._connection, [self._frame_header, self._frame_big_endian])
         except BrokenPipeError:
             _logger.info("Client disconnected.")
             self._stop_listening()
@@ -109,6 +116,8 @@ class TcpPedalDeviceMocker(PedalDeviceMocker):
                         _logger.info(f"DeviceMock listening on port {self._port}")
                         self._is_socket_initialized = True
                         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        # Allow restarting the mocker right away, while the previous connection is still in TIME_WAIT
+                        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                         self._socket.bind(("localhost", self._port))
                         self._socket.listen(1)
                         self._socket.settimeout(0.1)
@@ -119,6 +128,8 @@ class TcpPedalDeviceMocker(PedalDeviceMocker):
                     except:
                         _logger.exception("Error accepting connection")
                         continue
+                    # Responses are sent as soon as they are generated, do not let Nagle's algorithm delay them
+                    self._connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                     _logger.info(f"Connection from {addr} has been established!")
 
                 has_command = self._listen_command()
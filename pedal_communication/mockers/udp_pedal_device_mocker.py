@@ -1,7 +1,6 @@
-import json
 import logging
+import selectors
 import socket
-import struct
 import threading
 import time
 from typing import Tuple, List
@@ -11,9 +10,32 @@ import numpy as np
 from .pedal_device_mocker import PedalDeviceMocker
 from ..data.data import Data
 from ..devices.udp_communication_protocol import UdpProtocolConstants, UdpConfigurationProtocol
-from ..misc import recv_exact
+from ..misc import json_dumps, json_loads, recv_exact
 
-_logger = logging.getLogger("DeviceMock")
+_logger = logging.getLogger(__name__)
+
+
+def _serialize_control_response(operational_code: int, payload: bytes) -> bytes:
+    """
+    Serialize a control response (header then payload).
+    """
+    header = UdpProtocolConstants.control_header_struct.pack(
+        UdpProtocolConstants.control_magic_code,
+        UdpProtocolConstants.control_version,
+        operational_code,
+        len(payload),
+    )
+    return header + payload
+
+
+# Most responses never change, so they are serialized once and for all
+_config_ack_response = _serialize_control_response(UdpProtocolConstants.OperationalCode.ACK.value, b"OK")
+_start_ack_response = _serialize_control_response(UdpProtocolConstants.OperationalCode.ACK.value, b"STREAMING_STARTED")
+_stop_ack_response = _serialize_control_response(UdpProtocolConstants.OperationalCode.ACK.value, b"STREAMING_STOPPED")
+_ping_ack_response = _serialize_control_response(UdpProtocolConstants.OperationalCode.ACK.value, b"PONG")
+_unknown_opcode_error_response = _serialize_control_response(
+    UdpProtocolConstants.OperationalCode.ERR.value, b"unknown_opcode"
+)
 
 
 class UdpPedalDeviceMocker(PedalDeviceMocker):
@@ -21,7 +43,7 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
     See the UDP communication protocol specification for details:
     """
 
-    def __init__(self, control_port: int = 6000, data_port: int = 5999):
+    def __init__(self, control_port: int = 6000, data_port: int = 5999, data_socket_buffer_size: int = 1024 * 1024):
         # Server state
         self._are_sockets_initialized = False
         self._is_server_running = False
@@ -31,29 +53,59 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
         self._control_socket: socket.socket = None
         self._control_connection: socket.socket = None
         self._control_addr: Tuple[str, int] = None
+        # Waiting for a client is done by this selector (so the thread sleeps until something happens instead of waking
+        # up on a timeout), and writing to the wake up socket interrupts it
+        self._listening_selector: selectors.BaseSelector = None
+        self._wake_up_receiver, self._wake_up_sender = socket.socketpair()
 
         self._data_port = data_port
         self._data_socket: socket.socket = None
         self._data_addr: Tuple[str, int] = None
+        # A large send buffer absorbs the bursts of packets, instead of blocking (or dropping) while sending them
+        self._data_socket_buffer_size = data_socket_buffer_size
 
         # Streaming state
         self._stream_thread: threading.Thread = None
         self._stop_event: threading.Event = None
-        self._starting_device_clock = time.time()
+        self._starting_device_clock_ns = time.monotonic_ns()
 
         # Data constraints
         self._frequency = 50  # Hz
         self._sample_per_block = 10  # frames per block packet
         self._max_channel_count = Data.columns_count
         self._time_vector_template = np.arange(0, self._sample_per_block * 1 / self._frequency, 1 / self._frequency)
+        # Duration covered by one block, the device clock advances by that much from one block to the next
+        self._block_period = len(self._time_vector_template) / self._frequency
 
         # Data parameters (configurable)
         # Channels to serve + 1 so that time channel at index 0 is included
         self._channels_to_serve: List[int] = [val.value + 1 for val in list(UdpConfigurationProtocol.Channels)]
+        # The columns of a block that are sent (time then channels to serve), as an index array built once per
+        # configuration, so the payload is gathered in a single indexing
+        self._columns_to_serve = self._columns_to_serve_from(self._channels_to_serve)
         self._sequence_id = 0
+        # The packets are written in place in this buffer (header then payload) instead of concatenating new bytes
+        # objects each time. It only grows when a configuration needs larger packets
+        self._packet_buffer = bytearray(
+            UdpProtocolConstants.data_header_len
+            + self._sample_per_block * (self._max_channel_count + 1) * UdpProtocolConstants.data_dtype.itemsize
+        )
+        # Big-endian view over the payload part of the packet buffer, kept as long as the packet layout does not change
+        self._payload_view: np.ndarray = None
 
         # Simulate the fact that the Mocker is connected to a real device and gets blocks of data itself
-        self._data_simulator_current_data = np.ndarray(shape=(0, self._max_channel_count), dtype=np.float64)
+        # The simulator writes a block in one buffer while the streamer reads the other one, then flips them and
+        # signals the streamer, so the blocks are neither copied nor polled for. They are indexed as samples x
+        # channels, but stored channel by channel so the random values can be generated in place (out= requires a
+        # contiguous array)
+        self._data_simulator_buffers = [
+            np.empty((self._max_channel_count + 1, len(self._time_vector_template)), dtype=np.float64).T
+            for _ in range(2)
+        ]
+        self._data_simulator_random_generator = np.random.default_rng()
+        # Number of blocks published so far, the last one being in self._data_simulator_buffers[count & 1]
+        self._data_simulator_published_count = 0
+        self._data_simulator_new_data_event = threading.Event()
         self._data_simulator_stop_event = threading.Event()
         self._data_simulator_thread = threading.Thread(target=self._simulate_data)
         self._data_simulator_thread.start()
@@ -77,6 +129,13 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
         Dispose the mock device server.
         """
 
+        # Stop the control loop first, waking it up if it is waiting for a client. It closes the wake up sockets itself
+        # when it exits, as closing them now could discard the wake up before it sees it
+        if self._is_server_running:
+            self._is_server_running = False
+            self._wake_up_sender.send(b"\0")
+        else:
+            self._close_wake_up_sockets()
         self._stop_listening()
 
         self._control_socket = None
@@ -87,8 +146,6 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
         if self._data_simulator_thread:
             self._data_simulator_thread.join(timeout=1.0)
 
-        self._is_server_running = False
-
     def _start_listening(self) -> bool:
         try:
             if not self._are_sockets_initialized:
@@ -96,45 +153,73 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
                 self._control_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self._control_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self._control_socket.bind(("0.0.0.0", self._control_port))
-                self._control_socket.settimeout(0.1)
                 self._control_socket.listen(1)
 
                 self._data_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self._data_socket.settimeout(0.1)
+                self._data_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self._data_socket_buffer_size)
                 self._data_socket.bind(("0.0.0.0", self._data_port))
+
+                self._listening_selector = selectors.DefaultSelector()
+                self._listening_selector.register(self._control_socket, selectors.EVENT_READ)
+                self._listening_selector.register(self._data_socket, selectors.EVENT_READ)
+                self._listening_selector.register(self._wake_up_receiver, selectors.EVENT_READ)
                 self._are_sockets_initialized = True
 
-            if not self._control_connection:
+            # Sleep until a client connects, sends its first datagram, or dispose is called
+            ready_sockets = [key.fileobj for key, _ in self._listening_selector.select()]
+            if self._wake_up_receiver in ready_sockets:
+                self._wake_up_receiver.recv(64)
+                return False
+
+            if not self._control_connection and self._control_socket in ready_sockets:
                 self._control_connection, self._control_addr = self._control_socket.accept()
+                # The responses are small and each one is awaited by the client, so do not let Nagle's algorithm hold them
+                self._control_connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-            if self._control_connection:
+            if self._control_connection and self._data_socket in ready_sockets:
                 _, self._data_addr = self._data_socket.recvfrom(65536)
-
-        except socket.timeout:
-            return False
-        except:
-            _logger.exception("Error accepting connection")
+                # Send to that client only from now on, so the kernel resolves its address once instead of each packet.
+                # A new client gets a new data socket, as _stop_listening closes it
+                self._data_socket.connect(self._data_addr)
+            elif self._data_socket in ready_sockets:
+                # A datagram from no connected client, drop it so the selector does not keep reporting it
+                self._data_socket.recvfrom(65536)
+
+            if not self.is_connected:
+                # Either the control connection or the first datagram is still missing
+                return False
+
+        except OSError:
+            if self._is_server_running:  # Otherwise, dispose closed the sockets in the meantime
+                _logger.exception("Error accepting connection")
             return False
 
         _logger.info(f"Client connected from {self._control_addr}")
         return self.is_connected
 
+    def _close_wake_up_sockets(self):
+        self._wake_up_sender.close()
+        self._wake_up_receiver.close()
+
     def _stop_listening(self):
-        logger = logging.getLogger(__name__)
         self._stop_streaming()
 
         if self._control_connection:
             self._control_connection.close()
-            logger.info("Connection closed.")
+            _logger.info("Connection closed.")
         self._control_connection = None
         self._control_addr = None
 
+        if self._listening_selector is not None:
+            self._listening_selector.close()
+            self._listening_selector = None
+
         if self._control_socket is not None:
             self._control_socket.close()
 
         if self._data_socket is not None:
             self._data_socket.close()
-            logger.info("DeviceMock stopped listening.")
+            _logger.info("DeviceMock stopped listening.")
         self._data_addr = None
 
         self._are_sockets_initialized = False
@@ -149,8 +234,8 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
 
                 # read control header
                 header = recv_exact(self._control_connection, UdpProtocolConstants.control_header_len)
-                magic, version, operational_code, payload_len = struct.unpack(
-                    UdpProtocolConstants.control_header_format, header
+                magic, version, operational_code, payload_len = UdpProtocolConstants.control_header_struct.unpack(
+                    header
                 )
 
                 # Sanity check
@@ -164,10 +249,11 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
                 # dispatch based on opcode
                 if operational_code == UdpProtocolConstants.OperationalCode.SET_CONFIG.value:
                     # expect JSON payload with fields decribed in UdpCommunicationProtocol for OperationalCode.SET_CONFIG
-                    config: dict = json.loads(payload.decode("utf-8"))
+                    config: dict = json_loads(payload)
                     value = config.get("frequency")
                     if value is not None:
                         self._frequency = int(value)
+                        self._block_period = len(self._time_vector_template) / self._frequency
                     value = config.get("sample_per_block")
                     if value is not None:
                         self._sample_per_block = int(value)
@@ -176,31 +262,20 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
                         self._channels_to_serve = [
                             int(val) + 1 for val in value
                         ]  # +1 to include time channel at index 0
+                        self._columns_to_serve = self._columns_to_serve_from(self._channels_to_serve)
 
                     _logger.info(
                         f"SET_CONFIG: freq={self._frequency}Hz window={self._sample_per_block}s channels={self._channels_to_serve}"
                     )
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ACK.value,
-                        payload=b"OK",
-                    )
+                    self._control_connection.sendall(_config_ack_response)
 
                 elif operational_code == UdpProtocolConstants.OperationalCode.START.value:
                     self._start_streaming()
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ACK.value,
-                        payload=b"STREAMING_STARTED",
-                    )
+                    self._control_connection.sendall(_start_ack_response)
 
                 elif operational_code == UdpProtocolConstants.OperationalCode.STOP.value:
                     self._stop_streaming()
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ACK.value,
-                        payload=b"STREAMING_STOPPED",
-                    )
+                    self._control_connection.sendall(_stop_ack_response)
 
                 elif operational_code == UdpProtocolConstants.OperationalCode.GET_STATUS.value:
                     status = {
@@ -210,41 +285,31 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
                         "channels": self._channels_to_serve,
                         "sequence_id": self._sequence_id,
                     }
-                    payload_b = json.dumps(status).encode("utf-8")
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ACK.value,
-                        payload=payload_b,
+                    payload_b = json_dumps(status)
+                    self._control_connection.sendall(
+                        _serialize_control_response(UdpProtocolConstants.OperationalCode.ACK.value, payload_b)
                     )
 
                 elif operational_code == UdpProtocolConstants.OperationalCode.PING.value:
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ACK.value,
-                        payload=b"PONG",
-                    )
+                    self._control_connection.sendall(_ping_ack_response)
 
                 else:
                     _logger.warning(f"Unknown control opcode {operational_code}")
-                    self._send_control_response(
-                        self._control_connection,
-                        operational_code=UdpProtocolConstants.OperationalCode.ERR.value,
-                        payload=b"unknown_opcode",
-                    )
+                    self._control_connection.sendall(_unknown_opcode_error_response)
 
-            except Exception as e:
-                _logger.error(f"Error in DeviceMocker, resetting connection: {e}")
+            except OSError as e:  # Includes ConnectionError
+                # The client disconnected (or sent something that is not the protocol), wait for the next one. This also
+                # happens when dispose closes the sockets under the loop
+                if self._is_server_running:
+                    _logger.info(f"Control connection lost, resetting connection: {e}")
                 self._stop_listening()
 
-    def _send_control_response(self, conn: socket.socket, operational_code: int, payload: bytes):
-        header = struct.pack(
-            UdpProtocolConstants.control_header_format,
-            UdpProtocolConstants.control_magic_code,
-            UdpProtocolConstants.control_version,
-            operational_code,
-            len(payload),
-        )
-        conn.sendall(header + payload)
+            except Exception:
+                if self._is_server_running:
+                    _logger.exception("Error in DeviceMocker, resetting connection")
+                self._stop_listening()
+
+        self._close_wake_up_sockets()
 
     @property
     def is_streaming(self):
@@ -282,73 +347,117 @@ class UdpPedalDeviceMocker(PedalDeviceMocker):
             _logger.error("No client connected; aborting stream")
             return
 
-        last_frame_timestamp = -1
         while not self._stop_event.is_set():
             try:
-                # Fetch the current data (this should be thread-safe)
-                data = np.copy(self._data_simulator_current_data)
-
-                # If no new data were recorded, wait a bit
-                if last_frame_timestamp == data[-1, 0]:
-                    # This could be based on a OnNewData event to make sure data are served as soon as available
-                    time.sleep(0.001)
+                # Wait for the simulator to publish a new block (with a timeout so the stop event is checked regularly)
+                if not self._data_simulator_new_data_event.wait(timeout=0.1):
                     continue
+                self._data_simulator_new_data_event.clear()
 
-                # Prepare the packet to send
+                # Lock-free read (like a seqlock): the simulator only writes to the buffer that is not the last published
+                # one, so the packet is only torn if it published again while packing, in which case the newer block
+                # is packed instead
                 self._sequence_id = (self._sequence_id + 1) & 0xFFFFFFFF
+                while True:
+                    published_count = self._data_simulator_published_count
+                    packet_len = self._pack_data_packet(
+                        self._data_simulator_buffers[published_count & 1], self._sequence_id
+                    )
+                    if self._data_simulator_published_count == published_count:
+                        break
 
-                # Prepare the time vector and data matrix for this block
-                time_vector = data[:, 0]
-                data_matrix = data[:, self._channels_to_serve]
-                data_blocks = np.concatenate((time_vector[:, None], data_matrix), axis=1)
-
-                # pack header
-                header = struct.pack(
-                    UdpProtocolConstants.data_header_format,
-                    UdpProtocolConstants.data_magic_code,
-                    UdpProtocolConstants.data_version,
-                    self._sequence_id,
-                    self._sample_per_block,
-                    len(self._channels_to_serve) + 1,  # +1 for time channel
-                )
+                if self._data_addr is not None:
+                    self._data_socket.send(memoryview(self._packet_buffer)[:packet_len])
 
-                # pack data row-major by sample: sample0[ch0..chN], sample1[ch0..chN], ...
-                # total doubles = sample_count * channel_count
-                payload = b"".join(struct.pack("!d", float(x)) for x in data_blocks.flatten(order="C"))
+            except OSError as e:
+                # Usually the client is gone (its port is unreachable), which the control loop deals with
+                _logger.debug(f"Failed to send UDP packet to {self._data_addr}: {e}")
 
-                # full packet
-                packet = header + payload
+            except Exception:
+                _logger.exception(f"Failed to prepare UDP packet for {self._data_addr}")
 
-                if self._data_addr is not None:
-                    self._data_socket.sendto(packet, self._data_addr)
+    def _pack_data_packet(self, data: np.ndarray, sequence_id: int) -> int:
+        """
+        Write the packet of the block `data` (samples x all channels, time first) in the packet buffer.
+
+        Returns:
+            int: The length of the packet
+        """
+        # pack header
+        columns = self._columns_to_serve  # Read once, as SET_CONFIG may change it in the meantime
+        sample_count = data.shape[0]
+        channel_count = len(columns)  # Includes the time channel
+        UdpProtocolConstants.data_header_struct.pack_into(
+            self._packet_buffer_for(sample_count, channel_count),
+            0,
+            UdpProtocolConstants.data_magic_code,
+            UdpProtocolConstants.data_version,
+            sequence_id,
+            sample_count,
+            channel_count,
+        )
+
+        # pack data row-major by sample: sample0[ch0..chN], sample1[ch0..chN], ...
+        # total doubles = sample_count * channel_count. The time vector and the data matrix of this block are gathered
+        # at once and written into the payload (converted to big-endian in the same pass)
+        payload = self._payload_view
+        payload[...] = data[:, columns]
+        return UdpProtocolConstants.data_header_len + payload.nbytes
 
-                # schedule next frame
-                last_frame_timestamp = data[-1, 0]
+    @staticmethod
+    def _columns_to_serve_from(channels_to_serve: List[int]) -> np.ndarray:
+        """
+        Get the columns of a block to send for these channels (already offset by 1), the time column being first.
+        """
+        return np.array([0] + channels_to_serve, dtype=np.intp)
 
-            except Exception as e:
-                _logger.exception(f"Failed to send UDP packet to {self._data_addr}: {e}")
+    def _packet_buffer_for(self, sample_count: int, channel_count: int) -> bytearray:
+        """
+        Get the packet buffer, making sure it can hold a packet of `sample_count` samples of `channel_count` channels,
+        and point self._payload_view at its payload (as a sample_count x channel_count big-endian array).
+        """
+        if self._payload_view is None or self._payload_view.shape != (sample_count, channel_count):
+            packet_len = (
+                UdpProtocolConstants.data_header_len
+                + sample_count * channel_count * UdpProtocolConstants.data_dtype.itemsize
+            )
+            if len(self._packet_buffer) < packet_len:
+                self._packet_buffer = bytearray(packet_len)
+            self._payload_view = np.frombuffer(
+                self._packet_buffer,
+                dtype=UdpProtocolConstants.data_dtype,
+                count=sample_count * channel_count,
+                offset=UdpProtocolConstants.data_header_len,
+            ).reshape(sample_count, channel_count)
+        return self._packet_buffer
 
     def _simulate_data(self):
         """
         This method simulates the threads of the real device that generates data blocks that can be served to clients.
         """
-        next_frame_time = time.time()
-        while not self._data_simulator_stop_event.is_set():
-            now = time.time()
-            if now < next_frame_time:
-                time.sleep(min(1 / self._frequency * self._sample_per_block, next_frame_time - now))
-                continue
-
-            # Create a time vector based on elapsed time
-            time_increments = 1 / self._frequency * len(self._time_vector_template)
-            time_elapsed = time.time() - self._starting_device_clock
-            ratio = time_elapsed // (1 / self._frequency * len(self._time_vector_template))
-            time_vector = self._time_vector_template + ratio * time_increments
+        # The blocks are scheduled on absolute deadlines of the monotonic clock, so they do not drift and are not
+        # affected by changes of the wall clock. Waiting on the stop event sleeps until the next deadline in one go, and
+        # still returns as soon as dispose is called
+        next_frame_time_ns = time.monotonic_ns()
+        while True:
+            delay_ns = next_frame_time_ns - time.monotonic_ns()
+            if self._data_simulator_stop_event.wait(timeout=max(delay_ns, 0) / 1e9):
+                break
+
+            # The block is written in the buffer the streamer is not reading
+            data = self._data_simulator_buffers[(self._data_simulator_published_count + 1) & 1]
+
+            # Create a time vector based on elapsed time (written in place in the time column of the block)
+            block_period = self._block_period
+            time_elapsed = (time.monotonic_ns() - self._starting_device_clock_ns) / 1e9
+            np.add(self._time_vector_template, (time_elapsed // block_period) * block_period, out=data[:, 0])
 
             # Simulate some random data (time_vector length x n channels)
-            self._data_simulator_current_data = np.concatenate(
-                (time_vector[:, None], np.random.rand(len(time_vector), self._max_channel_count)), axis=1
-            )
+            self._data_simulator_random_generator.random(out=data[:, 1:].T)
+
+            # Publish it (rebinding an int is atomic under the GIL)
+            self._data_simulator_published_count += 1
+            self._data_simulator_new_data_event.set()
 
             # schedule next frame
-            next_frame_time += 1 / self._frequency * self._sample_per_block
+            next_frame_time_ns += self._sample_per_block * 1_000_000_000 // self._frequency
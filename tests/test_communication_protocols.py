@@ -0,0 +1,165 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from pedal_communication.devices.tpc_communication_protocol import TcpRequestProtocol, TcpResponseProtocol
+from pedal_communication.devices.udp_communication_protocol import (
+    UdpCommandProtocol,
+    UdpConfigurationProtocol,
+    UdpProtocolConstants,
+    UdpResponseProtocol,
+)
+
+
+def test_tcp_response_deserialize_from_memoryview():
+    expected = np.arange(460, dtype=np.float64)
+    header = struct.pack("!i", len(expected))
+    payload = struct.pack(f"!{len(expected)}d", *expected)
+
+    buffer = bytearray(header + payload)
+    view = memoryview(buffer)
+    data_length = TcpResponseProtocol.get_data_length_from_header(view[: TcpResponseProtocol.header_length])
+    assert data_length == len(payload)
+
+    data = TcpResponseProtocol.deserialize(view[TcpResponseProtocol.header_length :])
+    np.testing.assert_array_equal(data, expected.reshape(-1, 10).T)
+
+    # The output must not be affected when the receive buffer is reused
+    buffer[:] = b"\x00" * len(buffer)
+    np.testing.assert_array_equal(data, expected.reshape(-1, 10).T)
+
+
+def test_udp_response_deserialize():
+    expected = np.arange(10 * 46, dtype=np.float64).reshape(10, 46)
+    header = struct.pack(
+        UdpProtocolConstants.data_header_format,
+        UdpProtocolConstants.data_magic_code,
+        UdpProtocolConstants.data_version,
+        3,
+        expected.shape[0],
+        expected.shape[1],
+    )
+    packet = header + struct.pack(f"!{expected.size}d", *expected.flatten())
+
+    data, sequence_id = UdpResponseProtocol.deserialize(packet, previous_sequence_id=2)
+    assert sequence_id == 3
+    np.testing.assert_array_equal(data, expected)
+
+    # Duplicated and out of order packets are dropped
+    assert UdpResponseProtocol.deserialize(packet, previous_sequence_id=3) == (None, 3)
+    assert UdpResponseProtocol.deserialize(packet, previous_sequence_id=4) == (None, 4)
+
+    # Truncated packets are dropped
+    assert UdpResponseProtocol.deserialize(packet[:-8], previous_sequence_id=2) == (None, 2)
+
+    # Packets with a wrong magic code or version are dropped
+    bad_version_packet = packet[:2] + struct.pack("!H", UdpProtocolConstants.data_version + 1) + packet[4:]
+    assert UdpResponseProtocol.deserialize(bad_version_packet, previous_sequence_id=2) == (None, 2)
+    assert UdpResponseProtocol.deserialize(b"\x00\x00" + packet[2:], previous_sequence_id=2) == (None, 2)
+    assert UdpResponseProtocol.deserialize(memoryview(packet), previous_sequence_id=2)[1] == 3
+
+    # Without copy, the samples are a view over the packet
+    buffer = bytearray(packet)
+    data, _ = UdpResponseProtocol.deserialize(memoryview(buffer), previous_sequence_id=2, copy=False)
+    np.testing.assert_array_equal(data, expected)
+    buffer[UdpProtocolConstants.data_header_len :] = bytes(len(buffer) - UdpProtocolConstants.data_header_len)
+    np.testing.assert_array_equal(data, np.zeros_like(expected))
+
+
+def _udp_data_packet(sequence_id: int, values: np.ndarray) -> bytes:
+    header = struct.pack(
+        UdpProtocolConstants.data_header_format,
+        UdpProtocolConstants.data_magic_code,
+        UdpProtocolConstants.data_version,
+        sequence_id,
+        values.shape[0],
+        values.shape[1],
+    )
+    return header + values.astype(">f8").tobytes()
+
+
+def test_udp_response_deserialize_many():
+    frames = [np.full((10, 46), i, dtype=np.float64) for i in range(6)]
+    packets = [
+        _udp_data_packet(3, frames[0]),
+        _udp_data_packet(3, frames[1]),  # Duplicate
+        _udp_data_packet(5, frames[2]),  # Sequence 4 was lost
+        _udp_data_packet(4, frames[3]),  # Out of order
+        _udp_data_packet(6, frames[4])[:-8],  # Truncated
+        b"\x00" * 4,  # Too short to hold a header
+        _udp_data_packet(7, frames[5]),
+    ]
+
+    # The packets are received one after the other at a fixed stride in a single buffer
+    packet_stride = 8192
+    buffer = bytearray(packet_stride * len(packets))
+    for i, packet in enumerate(packets):
+        buffer[i * packet_stride : i * packet_stride + len(packet)] = packet
+    packet_lens = [len(packet) for packet in packets]
+
+    data, sequence_id = UdpResponseProtocol.deserialize_many(buffer, packet_lens, packet_stride, previous_sequence_id=2)
+    assert sequence_id == 7
+    np.testing.assert_array_equal(data, np.concatenate([frames[0], frames[2], frames[5]]))
+
+    # Same result as deserializing the packets one by one
+    previous_sequence_id = 2
+    expected = []
+    for packet in packets:
+        frame, previous_sequence_id = UdpResponseProtocol.deserialize(packet, previous_sequence_id=previous_sequence_id)
+        if frame is not None:
+            expected.append(frame)
+    np.testing.assert_array_equal(data, np.concatenate(expected))
+
+    assert UdpResponseProtocol.deserialize_many(buffer, packet_lens[:2], packet_stride, previous_sequence_id=3) == (
+        None,
+        3,
+    )
+    assert UdpResponseProtocol.deserialize_many(buffer, [], packet_stride, previous_sequence_id=3) == (None, 3)
+
+    # Frames of different lengths are stacked too
+    packets = [_udp_data_packet(1, frames[0]), _udp_data_packet(2, frames[1][:4])]
+    for i, packet in enumerate(packets):
+        buffer[i * packet_stride : i * packet_stride + len(packet)] = packet
+    data, sequence_id = UdpResponseProtocol.deserialize_many(buffer, [len(packet) for packet in packets], packet_stride)
+    assert sequence_id == 2
+    np.testing.assert_array_equal(data, np.concatenate([frames[0], frames[1][:4]]))
+
+
+def test_tcp_request_serialized():
+    request = TcpRequestProtocol(command=[TcpRequestProtocol.Command.FGx, TcpRequestProtocol.Command.TD])
+    assert request.serialized == struct.pack("!i", 4) + bytes([0, 0, 4, 1])
+    same_request = TcpRequestProtocol(command=[TcpRequestProtocol.Command.FGx, TcpRequestProtocol.Command.TD])
+    assert same_request.serialized is request.serialized
+
+    request = TcpRequestProtocol(request_type=TcpRequestProtocol.RequestType.NORMAL)
+    expected_commands = bytes(value for i in range(43) for j in range(10) for value in (i, j))
+    assert request.serialized == struct.pack("!i", len(expected_commands)) + expected_commands
+
+    # The full table is serialized once and shared by every NORMAL and FAST request
+    fast_request = TcpRequestProtocol(request_type=TcpRequestProtocol.RequestType.FAST)
+    assert fast_request.serialized is request.serialized
+
+
+def test_tcp_request_must_be_rectangular():
+    with pytest.raises(ValueError, match="rectangular"):
+        TcpRequestProtocol._serialize([[0, 0], [0]])
+
+
+def test_udp_configuration_serialized():
+    request = UdpConfigurationProtocol(channels=[UdpConfigurationProtocol.Channels.FX_LEFT])
+    header_len = UdpProtocolConstants.control_header_len
+    magic, version, operational_code, payload_len = UdpProtocolConstants.control_header_struct.unpack_from(
+        request.serialized
+    )
+    assert magic == UdpProtocolConstants.control_magic_code
+    assert version == UdpProtocolConstants.control_version
+    assert operational_code == UdpProtocolConstants.OperationalCode.SET_CONFIG.value
+    assert payload_len == len(request.serialized) - header_len
+    assert json.loads(request.serialized[header_len:]) == {"channels": [0], "frequency": None, "sample_per_block": None}
+
+    command = UdpCommandProtocol(UdpProtocolConstants.OperationalCode.START)
+    operational_code = UdpProtocolConstants.control_header_struct.unpack_from(command.serialized)[2]
+    assert operational_code == UdpProtocolConstants.OperationalCode.START.value
+    assert json.loads(command.serialized[header_len:]) == {}
@@ -0,0 +1,143 @@
+import threading
+
+import numpy as np
+import pytest
+
+from pedal_communication import Data, DataCollector
+from pedal_communication.data.data import _RingBuffer
+
+
+def test_data_add_data():
+    data = Data()
+    assert data.is_empty
+
+    new_data = np.arange(10 * (Data.columns_count + 1), dtype=np.float64).reshape(10, Data.columns_count + 1)
+    data.add_data(new_data)
+    assert not data.is_empty
+    np.testing.assert_array_equal(data.timestamp, new_data[:, 0])
+    np.testing.assert_array_equal(data.values, new_data[:, 1:])
+
+
+def test_data_add_data_grows_buffer():
+    data = Data()
+    row_count = 3000  # Larger than the initial capacity
+    for i in range(row_count):
+        data.add_data(np.full((1, Data.columns_count + 1), i, dtype=np.float64))
+
+    assert len(data.timestamp) == row_count
+    np.testing.assert_array_equal(data.timestamp, np.arange(row_count))
+    np.testing.assert_array_equal(data.values[:, -1], np.arange(row_count))
+
+
+def test_data_slicing():
+    new_data = np.arange(10 * (Data.columns_count + 1), dtype=np.float64).reshape(10, Data.columns_count + 1)
+    data = Data(data=new_data)
+
+    sliced = data[5:]
+    np.testing.assert_array_equal(sliced.timestamp, new_data[5:, 0])
+
+    single = data[2]
+    np.testing.assert_array_equal(single.values, new_data[2:3, 1:])
+
+
+def test_data_clear():
+    data = Data(data=np.zeros((10, Data.columns_count + 1)))
+    data.clear()
+    assert data.is_empty
+    assert len(data.timestamp) == 0
+
+
+def test_data_wrong_shape():
+    with pytest.raises(ValueError, match="Data must have"):
+        Data(data=np.zeros((10, Data.columns_count)))
+
+
+def test_data_clear_does_not_modify_the_slices():
+    new_data = np.arange(10 * (Data.columns_count + 1), dtype=np.float64).reshape(10, Data.columns_count + 1)
+    data = Data(data=new_data)
+
+    sliced = data[0:3]
+    timestamp = data.timestamp
+    data.clear()
+    data.add_data(np.full((3, Data.columns_count + 1), -1, dtype=np.float64))
+
+    np.testing.assert_array_equal(sliced.timestamp, new_data[0:3, 0])
+    np.testing.assert_array_equal(sliced.values, new_data[0:3, 1:])
+    np.testing.assert_array_equal(timestamp, new_data[:, 0])
+    np.testing.assert_array_equal(data.timestamp, [-1, -1, -1])
+
+
+def test_ring_buffer_wraps():
+    ring = _RingBuffer(capacity=8, columns_count=2)
+    for i in range(3):
+        ring.push(np.full((3, 2), i, dtype=np.float64))
+    assert ring.head == 9
+
+    chunks = list(ring.chunks(4, 9))
+    assert [len(chunk) for chunk in chunks] == [4, 1]
+    np.testing.assert_array_equal(np.concatenate(chunks)[:, 0], [1, 1, 2, 2, 2])
+
+    # More rows than the capacity, only the last ones are kept
+    ring.push(np.arange(20, dtype=np.float64)[:, None].repeat(2, axis=1))
+    assert ring.head == 29
+    chunks = list(ring.chunks(ring.head - ring.capacity, ring.head))
+    np.testing.assert_array_equal(np.concatenate(chunks)[:, 0], np.arange(12, 20))
+
+    with pytest.raises(ValueError, match="power of two"):
+        _RingBuffer(capacity=10, columns_count=2)
+
+
+def test_data_collector():
+    class FakeDevice:
+        frames_to_produce = 20
+
+        def __init__(self):
+            self.frame_count = 0
+            # Set when the collector asks for a frame after the last one, so the last one was already pushed
+            self.all_frames_collected = threading.Event()
+
+        def get_last_data(self):
+            if self.frame_count == self.frames_to_produce:
+                self.all_frames_collected.set()
+                return None
+            frame = np.full((10, Data.columns_count + 1), self.frame_count, dtype=np.float64)
+            self.frame_count += 1
+            return frame
+
+        def disconnect(self):
+            return True
+
+    device = FakeDevice()
+    collector = DataCollector(device)
+    collector.start()
+    assert device.all_frames_collected.wait(timeout=5.0)
+    collector.stop()
+
+    data = collector.data
+    assert len(data.timestamp) == FakeDevice.frames_to_produce * 10
+    np.testing.assert_array_equal(data.timestamp, np.repeat(np.arange(FakeDevice.frames_to_produce), 10))
+
+
+def test_data_slicing_does_not_modify_the_original():
+    new_data = np.arange(10 * (Data.columns_count + 1), dtype=np.float64).reshape(10, Data.columns_count + 1)
+    data = Data(data=new_data)
+
+    sliced = data[2:5]
+    sliced.clear()
+    sliced.add_data(np.full((1, Data.columns_count + 1), -1, dtype=np.float64))
+    sliced.add_data(np.full((1, Data.columns_count + 1), -2, dtype=np.float64))
+
+    np.testing.assert_array_equal(sliced.timestamp, [-1, -2])
+    np.testing.assert_array_equal(data.timestamp, new_data[:, 0])
+
+
+def test_data_add_data_is_amortized():
+    data = Data()
+    buffer_ids = set()
+    for i in range(10000):
+        data.add_data(np.full((1, Data.columns_count + 1), i, dtype=np.float64))
+        buffer_ids.add(id(data._values))
+
+    # The buffer doubles when full, so it is only reallocated a logarithmic number of times
+    assert len(buffer_ids) <= int(np.ceil(np.log2(10000 / Data._initial_capacity))) + 1
+    np.testing.assert_array_equal(data.timestamp, np.arange(10000))
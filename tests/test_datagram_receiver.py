@@ -0,0 +1,76 @@
+import socket
+import time
+
+import pytest
+
+from pedal_communication.misc import datagram_receiver
+from pedal_communication.misc.datagram_receiver import DatagramBatchReceiver
+
+
+@pytest.fixture
+def sockets():
+    receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_socket.bind(("127.0.0.1", 0))
+    receiver_socket.setblocking(False)
+    sender_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    yield receiver_socket, sender_socket
+    receiver_socket.close()
+    sender_socket.close()
+
+
+@pytest.mark.parametrize("use_recvmmsg", [True, False])
+def test_datagram_batch_receiver(sockets, monkeypatch, use_recvmmsg):
+    if use_recvmmsg and datagram_receiver._recvmmsg is None:
+        pytest.skip("recvmmsg is not available on this platform")
+    if not use_recvmmsg:
+        monkeypatch.setattr(datagram_receiver, "_recvmmsg", None)
+
+    receiver_socket, sender_socket = sockets
+    slot_len = 64
+    buffer = bytearray(slot_len * 4)
+    receiver = DatagramBatchReceiver(buffer, slot_len)
+    assert receiver.slot_count == 4
+
+    # Nothing is queued yet
+    assert receiver.receive(receiver_socket) == []
+
+    datagrams = [bytes([i]) * (10 + i) for i in range(6)]
+    for datagram in datagrams:
+        sender_socket.sendto(datagram, receiver_socket.getsockname())
+
+    received = []
+    for _ in range(100):
+        if len(received) >= len(datagrams):
+            break
+        packet_lens = receiver.receive(receiver_socket)
+        assert len(packet_lens) <= receiver.slot_count
+        received += [
+            bytes(buffer[i * slot_len : i * slot_len + packet_len]) for i, packet_len in enumerate(packet_lens)
+        ]
+    assert received == datagrams
+
+
+def test_datagram_batch_receiver_wrong_buffer():
+    with pytest.raises(ValueError, match="at least one slot"):
+        DatagramBatchReceiver(bytearray(10), 64)
+
+
+def test_datagram_batch_receiver_dropped_count(sockets):
+    receiver_socket, sender_socket = sockets
+    if datagram_receiver._recvmmsg is None or not datagram_receiver.enable_drop_counter(receiver_socket):
+        pytest.skip("The kernel drop counter is not available on this platform")
+
+    # Overflow a tiny receive buffer
+    receiver_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+    for _ in range(100):
+        sender_socket.sendto(bytes(1000), receiver_socket.getsockname())
+
+    receiver = DatagramBatchReceiver(bytearray(1024 * 4), 1024)
+    while receiver.receive(receiver_socket):
+        pass
+    assert receiver.dropped_count == 0
+
+    # The count of dropped datagrams is attached to the datagrams queued after the drops
+    sender_socket.sendto(bytes(10), receiver_socket.getsockname())
+    assert receiver.receive(receiver_socket) == [10]
+    assert receiver.dropped_count > 0
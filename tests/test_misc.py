@@ -0,0 +1,102 @@
+import selectors
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from pedal_communication.misc import recv_exact, recv_exact_into, sendall_buffers
+
+
+def _send_in_chunks(sender: socket.socket, data: bytes, chunk_len: int):
+    for i in range(0, len(data), chunk_len):
+        sender.sendall(data[i : i + chunk_len])
+
+
+def test_recv_exact():
+    receiver, sender = socket.socketpair()
+    data = bytes(range(256)) * 64
+
+    # Whole message at once
+    sender.sendall(data[:100])
+    assert recv_exact(receiver, 100) == data[:100]
+
+    # Message split in many chunks
+    thread = threading.Thread(target=_send_in_chunks, args=(sender, data, 1000))
+    thread.start()
+    assert recv_exact(receiver, len(data)) == data
+    thread.join()
+
+    assert recv_exact(receiver, 0) == b""
+
+    sender.close()
+    with pytest.raises(ConnectionError):
+        recv_exact(receiver, 10)
+    receiver.close()
+
+
+def test_recv_exact_with_selector():
+    receiver, sender = socket.socketpair()
+    selector = selectors.DefaultSelector()
+    selector.register(receiver, selectors.EVENT_READ)
+    data = bytes(range(256)) * 64
+
+    thread = threading.Thread(target=_send_in_chunks, args=(sender, data, 1000))
+    thread.start()
+    assert recv_exact(receiver, len(data), selector=selector, timeout=5.0) == data
+    thread.join()
+
+    # Nothing is sent, so it times out instead of blocking forever
+    with pytest.raises(TimeoutError):
+        recv_exact(receiver, 10, selector=selector, timeout=0.05)
+    sender.sendall(data[:5])
+    with pytest.raises(TimeoutError):
+        recv_exact(receiver, 10, selector=selector, timeout=0.05)
+
+    selector.close()
+    sender.close()
+    receiver.close()
+
+
+def test_recv_exact_into():
+    receiver, sender = socket.socketpair()
+    data = bytes(range(256)) * 64
+    buffer = bytearray(len(data) + 10)
+
+    thread = threading.Thread(target=_send_in_chunks, args=(sender, data, 1000))
+    thread.start()
+    assert recv_exact_into(receiver, buffer, len(data)) == data
+    thread.join()
+
+    sender.close()
+    with pytest.raises(ConnectionError):
+        recv_exact_into(receiver, buffer, 10)
+    receiver.close()
+
+
+@pytest.mark.parametrize("use_sendmsg", [True, False])
+def test_sendall_buffers(use_sendmsg):
+    receiver, sender = socket.socketpair()
+    if not use_sendmsg:
+        # Hide sendmsg to check the fallback
+        class _Socket:
+            sendall = sender.sendall
+
+        sender_socket = _Socket()
+    else:
+        sender_socket = sender
+
+    header = b"\x00\x00\x00\x04"
+    payload = np.arange(4, dtype=">f8")
+    sendall_buffers(sender_socket, [header, payload])
+    assert recv_exact(receiver, 4 + 32) == header + payload.tobytes()
+
+    # Large enough to be sent in several calls
+    payload = bytes(range(256)) * 8192
+    thread = threading.Thread(target=sendall_buffers, args=(sender_socket, [header, payload]))
+    thread.start()
+    assert recv_exact(receiver, len(header) + len(payload)) == header + payload
+    thread.join()
+
+    sender.close()
+    receiver.close()
@@ -0,0 +1,48 @@
+import socket
+import threading
+
+import numpy as np
+
+from pedal_communication import TcpPedalDevice
+from pedal_communication.misc import recv_exact
+
+
+def _serve_one_frame_per_connection(server: socket.socket, connection_count: int, closed_event: threading.Event):
+    for i in range(connection_count):
+        connection, _ = server.accept()
+        request_length = int.from_bytes(recv_exact(connection, 4), "big")
+        recv_exact(connection, request_length)
+
+        # A frame of 10 samples of 2 channels (the time then one value), sent channel by channel
+        frame = np.array([np.arange(10, dtype=np.float64) + 10 * i, np.full(10, i, dtype=np.float64)])
+        connection.sendall(frame.size.to_bytes(4, "big") + frame.astype(">f8").tobytes())
+        if i == connection_count - 1:
+            closed_event.wait(timeout=5.0)
+        connection.close()
+
+
+def test_tcp_pedal_device_reconnects_when_the_device_closes_the_connection():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("localhost", 0))
+    server.listen(1)
+    server.settimeout(5.0)  # So the server thread does not wait forever if the device never reconnects
+    done_event = threading.Event()
+    thread = threading.Thread(target=_serve_one_frame_per_connection, args=(server, 2, done_event), daemon=True)
+    thread.start()
+
+    device = TcpPedalDevice(port=server.getsockname()[1], pipeline_depth=1, timeout=5.0)
+    data = device.get_last_data()
+    np.testing.assert_array_equal(data[:, 0], np.arange(10))
+
+    # The device closed the connection, so the device disconnects, then reconnects on the next call
+    assert device.get_last_data() is None
+    assert not device.is_connected
+    data = device.get_last_data()
+    assert device.is_connected
+    np.testing.assert_array_equal(data[:, 0], np.arange(10) + 10)
+    np.testing.assert_array_equal(data[:, 1], np.ones(10))
+
+    done_event.set()
+    thread.join()
+    device.disconnect()
+    server.close()